@@ -16,9 +16,14 @@ if model_dir not in sys.path:
     sys.path.append(model_dir)
 
 try:
-    from src.utility.preprocessing import ImagePreprocessor
-    from src.model.florence import FlorenceModel
-    from src.model.donut import DonutModel
+    from src.utility.preprocessing import ImagePreprocessor, PREPROCESS_MODE
+    from src.model.registry import ModelRegistry, DEFAULT_ENGINE
+    from src.model.cached import CachedModel
+    from src.utility.cache import DiskCache, ImageCache, content_key, image_digest
+    from src.utility.jobs import JobExecutor, QUEUED, RUNNING, DONE, FAILED
+    from src.utility.parsing import get_parse_stats
+    from src.utility.metrics import REGISTRY
+    from src.model.hooks import MetricsHook, TraceHook
 except ImportError as e:
     st.error(f"Import Error: {e}. Cek struktur folder.")
     st.stop()
@@ -28,23 +33,118 @@ st.set_page_config(layout="wide", page_title="Split Bill OCR Sat-Set", page_icon
 
 # --- CACHED FUNCTIONS ---
 
-@st.cache_resource(show_spinner="Loading Florence-2 Model...")
-def get_florence_model():
-    return FlorenceModel()
+@st.cache_resource
+def get_result_cache():
+    return DiskCache()
 
-@st.cache_resource(show_spinner="Loading Donut Model...")
-def get_donut_model():
-    return DonutModel()
+@st.cache_resource
+def get_image_cache():
+    # Pengganti st.cache_data: ada batas byte + TTL, hasil disimpan sebagai PNG
+    return ImageCache()
 
-@st.cache_data(show_spinner="Processing Image (Auto-Crop & Deskew)...")
-def process_uploaded_image(image_file):
-    return ImagePreprocessor.process_image(image_file)
+@st.cache_resource
+def get_trace_hook():
+    return TraceHook()
+
+@st.cache_resource
+def get_job_executor():
+    # Satu executor per proses: scan gambar + engine yang sama dari sesi lain digabung
+    return JobExecutor(max_workers=int(os.getenv("SCAN_WORKERS", 2)))
+
+@st.cache_resource
+def setup_metrics():
+    cache = get_result_cache()
+    image_cache = get_image_cache()
+    executor = get_job_executor()
+    REGISTRY.add_collector(lambda: {f"ocr_parse_{k}": v for k, v in get_parse_stats().items()})
+    REGISTRY.add_collector(lambda: {f"ocr_result_cache_{k}": v for k, v in cache.stats().items()})
+    REGISTRY.add_collector(lambda: {f"ocr_image_cache_{k}": v for k, v in image_cache.stats().items()})
+    REGISTRY.add_collector(lambda: {f"ocr_scan_jobs_{k}": v for k, v in executor.stats().items()})
+    # Endpoint /metrics opsional, misal METRICS_PORT=9100
+    if os.getenv("METRICS_PORT"):
+        REGISTRY.serve_prometheus(int(os.getenv("METRICS_PORT")))
+    return REGISTRY
+
+def instrument(model):
+    model = CachedModel(model, get_result_cache())
+    model.add_hook(MetricsHook())
+    model.add_hook(get_trace_hook())
+    return model
+
+@st.cache_resource
+def get_model_registry():
+    # Engine default di-load + warm-up di background selagi user upload foto
+    # OCR_SERVER_URL diset -> model dipegang src/server.py, app cuma jadi client
+    registry = ModelRegistry(wrap=instrument, remote=os.getenv("OCR_SERVER_URL"))
+    registry.warmup_async(DEFAULT_ENGINE)
+    return registry
+
+def process_uploaded_image(image_file, engine_key):
+    target_size = None
+    if PREPROCESS_MODE == "single-warp":
+        # Mode single-warp langsung resize ke lebar input engine; ukurannya dari tabel registry,
+        # jadi render pertama nggak nunggu from_pretrained
+        target_size = model_registry.input_size(engine_key)
+    # Byte upload dibaca sekali, dipakai untuk key cache & decode
+    data = image_file.getvalue()
+    key = f"{content_key(data)}:{PREPROCESS_MODE}:{target_size}"
+    with st.spinner("Processing Image (Auto-Crop & Deskew)..."):
+        return get_image_cache().get_or_compute(
+            key, lambda: ImagePreprocessor.process_image(data, target_size=target_size)
+        )
+
+metrics = setup_metrics()
+model_registry = get_model_registry()
+
+@st.cache_resource
+def setup_registry_metrics():
+    # Residency engine (memori, load/reload/evict) per proses
+    REGISTRY.add_collector(model_registry.metrics)
+    return True
+
+setup_registry_metrics()
+
+ENGINE_KEYS = {"Donut": "donut", "Florence-2": "florence", "Auto (Cascade)": "cascade"}
+STATE_LABELS = {
+    "not_loaded": "belum di-load",
+    "loading": "loading...",
+    "warming_up": "warm-up...",
+    "ready": "siap",
+    "offloaded": "di-offload (mmap)",
+    "error": "gagal",
+}
+
+def scan_job(job, engine_key, image, use_tiling):
+    """Jalan di thread background, bukan di script run Streamlit."""
+    model = model_registry.get(engine_key)
+    job.check_cancelled()
+    # Dicek di dalam generate & antar stage, jadi decoding berhenti begitu scan dibatalkan
+    should_stop = lambda: job.cancel_requested
+
+    strips = model.strips(image) if use_tiling else [image]
+    if len(strips) > 1:
+        job.progress = f"Nota panjang: membaca {len(strips)} strip..."
+        receipt = model.run_tiled(image, should_stop)
+    else:
+        # Teks OCR parsial ditaruh di job.progress, UI yang polling nampilin
+        stream = model.run_stream(image, should_stop)
+        for chunk in stream:
+            job.progress += chunk
+            job.check_cancelled()
+        receipt = stream.result()
+    job.check_cancelled()
+    return receipt
+
+job_executor = get_job_executor()
+POLL_INTERVAL = 0.5
 
 # --- SESSION STATE ---
 if 'receipt_data' not in st.session_state:
     st.session_state.receipt_data = None
 if 'assignments' not in st.session_state:
     st.session_state.assignments = {} 
+if 'scan_job' not in st.session_state:
+    st.session_state.scan_job = None
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -55,7 +155,52 @@ with st.sidebar:
     participants = [p.strip() for p in participants_input.split(',') if p.strip()]
     
     st.subheader("2. Model AI")
-    model_choice = st.selectbox("Engine", ["Donut", "Florence-2"])
+    model_choice = st.selectbox("Engine", list(ENGINE_KEYS))
+    use_tiling = st.checkbox(
+        "Mode nota panjang (tiling)",
+        value=os.getenv("OCR_TILING", "1") == "1",
+        help="Nota yang panjang dipotong jadi beberapa strip, dibaca paralel, lalu digabung.",
+    )
+    engine_status = model_registry.status()
+    for label, key in ENGINE_KEYS.items():
+        state = engine_status[key]
+        caption = f"{label}: {STATE_LABELS[state['state']]}"
+        if "load_seconds" in state:
+            caption += f" (load {state['load_seconds']:.1f}s, warm-up {state.get('warmup_seconds', 0):.1f}s)"
+        if state["memory_bytes"]:
+            caption += f", {state['memory_bytes'] / 1e6:.0f} MB"
+        if state["reloads"]:
+            caption += f", reload {state['reloads']}x"
+        st.caption(caption)
+
+    cache_stats = get_result_cache().stats()
+    st.caption(f"Cache hasil: {cache_stats['entries']} nota, hit {cache_stats['hits']} / miss {cache_stats['misses']}")
+    image_stats = get_image_cache().stats()
+    st.caption(
+        f"Cache gambar: {image_stats['entries']} foto, {image_stats['bytes'] / 1e6:.1f}"
+        f" / {image_stats['max_bytes'] / 1e6:.0f} MB, evict {image_stats['evictions']}"
+    )
+    parse_stats = get_parse_stats()
+    st.caption(f"Parser lokal: {parse_stats['fast_path']} nota ({parse_stats['fast_path_rate']:.0%}) tanpa LLM, {parse_stats['llm']} ke LLM")
+    st.caption(
+        f"Cache LLM: hit {parse_stats['llm_cache_hit_rate']:.0%}, hemat ~"
+        f"{parse_stats['cache_tokens_saved'] + parse_stats['compaction_tokens_saved']} token"
+    )
+
+    with st.expander("🔍 Debug: Latency per Stage"):
+        trace = get_trace_hook().latest()
+        if trace is None:
+            st.caption("Belum ada scan.")
+        else:
+            st.caption(f"Scan terakhir ({trace['engine']})")
+            st.dataframe(
+                [
+                    {"stage": s["stage"], "ms": s["ms"], "tokens": s.get("tokens"), "decoding": s.get("decoding")}
+                    for s in trace["stages"]
+                ],
+                hide_index=True,
+            )
+        st.code(metrics.render_prometheus(), language="text")
 
 # --- MAIN PAGE ---
 st.title("🧾 Split Bill OCR")
@@ -68,7 +213,7 @@ processed_image = None
 
 if uploaded_file is not None:
     try:
-        processed_image = process_uploaded_image(uploaded_file)
+        processed_image = process_uploaded_image(uploaded_file, ENGINE_KEYS[model_choice])
         
         col1, col2 = st.columns(2)
         with col1:
@@ -80,29 +225,58 @@ if uploaded_file is not None:
             if not participants:
                 st.warning("Isi dulu daftar partisipan di sidebar!")
             else:
-                try:
-                    if model_choice == "Florence-2":
-                        model = get_florence_model()
-                    else:
-                        model = get_donut_model()
-                    
-                    with st.spinner(f"Sedang membaca nota pake {model_choice}..."):
-                        receipt = model.run(processed_image)
-                        st.session_state.receipt_data = receipt
-                        st.session_state.assignments = {} 
-                    
-                except Exception as e:
-                    st.error(f"Model Crash: {e}")
+                engine_key = ENGINE_KEYS[model_choice]
+                job_key = f"{engine_key}:{int(use_tiling)}:{image_digest(processed_image)}"
+                st.session_state.scan_job = job_executor.submit(
+                    job_key, scan_job, engine_key, processed_image, use_tiling
+                )
                     
     except Exception as e:
          st.error(f"Gagal Preprocess: {e}")
 
+@st.fragment(run_every=POLL_INTERVAL)
+def scan_status():
+    """Cuma blok status ini yang di-rerun tiap POLL_INTERVAL, bukan seluruh script (decode gambar, dll)."""
+    job = job_executor.get(st.session_state.scan_job) if st.session_state.scan_job else None
+    if job is None or job.status not in (QUEUED, RUNNING):
+        # Selesai: rerun penuh supaya hasil / pesan error dirender di luar fragment
+        st.rerun()
+    label = "Nunggu giliran scan..." if job.status == QUEUED else f"Sedang membaca nota pake {model_choice}..."
+    with st.status(label, expanded=True):
+        st.text(job.progress or "...")
+    if st.button("Batalkan Scan"):
+        job_executor.cancel(job.id)
+        st.session_state.scan_job = None
+        st.rerun()
+
+# SCAN JOB: polling status tanpa nge-block script run
+if st.session_state.scan_job:
+    job = job_executor.get(st.session_state.scan_job)
+    if job is None:
+        st.session_state.scan_job = None
+    elif job.status in (QUEUED, RUNNING):
+        scan_status()
+    else:
+        st.session_state.scan_job = None
+        if job.status == DONE:
+            st.session_state.receipt_data = job.result
+            st.session_state.assignments = {}
+            # File metrics opsional untuk node_exporter textfile collector
+            if os.getenv("METRICS_FILE"):
+                metrics.write_prometheus(os.getenv("METRICS_FILE"))
+        elif job.status == FAILED:
+            st.error(f"Model Crash: {job.error}")
+        else:
+            st.info("Scan dibatalkan.")
+
 # SECTION 2: ASSIGNMENT
 if st.session_state.receipt_data:
     st.divider()
     st.subheader("📝 Assign Menu ke Partisipan")
     
     data = st.session_state.receipt_data
+    if data.meta:
+        st.caption(" · ".join(f"{k}: {v}" for k, v in data.meta.items()))
     
     if not data.items:
         st.warning("⚠️ Tidak ada item terdeteksi. Coba model lain atau foto ulang.")
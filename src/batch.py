@@ -0,0 +1,192 @@
+"""
+Batch runner tanpa UI untuk backfill nota arsip.
+
+    python src/batch.py data/ -o hasil.jsonl --engine donut --workers 4 --batch-size 4
+
+Input bisa folder (dicari rekursif) atau manifest: .txt (satu path per baris)
+atau .jsonl ({"id": ..., "path": ...}). Output JSONL ditulis per nota begitu
+selesai; kalau dijalankan ulang, ID yang sudah ada di output di-skip (resume).
+Record error (Model Crash, Gagal Preprocess) dicoba lagi waktu resume, kecuali
+pakai --skip-errors; record terakhir per ID yang berlaku.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# --- PATH SETUP ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+
+model_dir = os.path.join(current_dir, "model")
+if model_dir not in sys.path:
+    sys.path.append(model_dir)
+
+from src.utility.preprocessing import ImagePreprocessor
+from src.model.registry import ENGINES, load_engine
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+def iter_inputs(source: str):
+    """Yield (receipt_id, path) dari folder atau manifest."""
+    if os.path.isdir(source):
+        for dirpath, _, filenames in sorted(os.walk(source)):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(dirpath, filename)
+                    yield os.path.relpath(path, source), path
+        return
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if source.endswith(".jsonl"):
+                entry = json.loads(line)
+                path = entry["path"]
+                receipt_id = str(entry.get("id", path))
+            else:
+                path = receipt_id = line
+            yield receipt_id, path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+def load_done_ids(output_path: str, include_errors: bool = False) -> set:
+    """ID yang sudah ada di output. Record error (OOM, network, ...) nggak dihitung, kecuali `include_errors`."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if include_errors or "error" not in record:
+                    done.add(record["id"])
+            except (ValueError, KeyError):
+                # Baris terakhir bisa kepotong kalau proses sebelumnya crash
+                continue
+    return done
+
+def receipt_to_dict(receipt) -> dict:
+    return {
+        "items": [
+            {"name": it.name, "qty": it.count, "price": it.total_price}
+            for it in receipt.items.values()
+        ],
+        "subtotal": receipt.subtotal,
+        "total": receipt.total,
+        "meta": receipt.meta,
+    }
+
+def _preprocess_job(receipt_id: str, path: str, target_size=None):
+    """Jalan di process pool: return (id, path, image, timings, error)."""
+    timings = {}
+    try:
+        image = ImagePreprocessor.process_image(path, timings=timings, target_size=target_size)
+        return receipt_id, path, image, timings, None
+    except Exception as e:
+        return receipt_id, path, None, timings, f"Gagal Preprocess: {e}"
+
+class JsonlWriter:
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+        self.count = 0
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+def run_model_batch(model, batch, writer: JsonlWriter, tiled: bool = False):
+    start = time.perf_counter()
+    try:
+        images = [image for _, _, image, _ in batch]
+        if tiled:
+            # Strip satu nota sudah di-batch di dalam run_tiled
+            receipts = [model.run_tiled(image) for image in images]
+        else:
+            receipts = model.run_batch(images)
+        error = None
+    except Exception as e:
+        receipts = [None] * len(batch)
+        error = f"Model Crash: {e}"
+    # Waktu model dibagi rata per nota dalam satu batch
+    model_time = (time.perf_counter() - start) / len(batch)
+
+    for (receipt_id, path, _, timings), receipt in zip(batch, receipts):
+        record = {"id": receipt_id, "path": path}
+        if receipt is not None:
+            record.update(receipt_to_dict(receipt))
+        else:
+            record["error"] = error
+        record["timings"] = {**timings, "model": model_time}
+        writer.write(record)
+
+def run(args):
+    done = load_done_ids(args.output, include_errors=args.skip_errors)
+    pending_inputs = [(rid, path) for rid, path in iter_inputs(args.input) if rid not in done]
+    print(f"{len(done)} nota sudah ada di output, {len(pending_inputs)} nota diproses.", file=sys.stderr)
+    if not pending_inputs:
+        return
+
+    model = load_engine(args.engine, profile=args.profile)
+    writer = JsonlWriter(args.output)
+    batch = []
+    max_in_flight = args.workers * 2 + args.batch_size
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            queue = iter(pending_inputs)
+            in_flight = set()
+
+            while True:
+                # Batasi jumlah gambar yang nunggu di memori
+                for receipt_id, path in queue:
+                    in_flight.add(pool.submit(_preprocess_job, receipt_id, path, model.input_size))
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    break
+
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    receipt_id, path, image, timings, error = future.result()
+                    if error:
+                        writer.write({"id": receipt_id, "path": path, "error": error, "timings": timings})
+                        continue
+                    batch.append((receipt_id, path, image, timings))
+
+                if len(batch) >= args.batch_size or (batch and not in_flight):
+                    run_model_batch(model, batch[:args.batch_size], writer, args.tiled)
+                    batch = batch[args.batch_size:]
+
+            while batch:
+                run_model_batch(model, batch[:args.batch_size], writer, args.tiled)
+                batch = batch[args.batch_size:]
+    finally:
+        writer.close()
+
+    print(f"Selesai: {writer.count} nota ditulis ke {args.output}.", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch OCR nota ke JSONL.")
+    parser.add_argument("input", help="Folder gambar atau manifest (.txt / .jsonl)")
+    parser.add_argument("-o", "--output", required=True, help="File output JSONL (append + resume)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="donut")
+    parser.add_argument("--tiled", action="store_true", help="Nota panjang dipotong jadi strip overlap (run_tiled)")
+    parser.add_argument("--skip-errors", action="store_true", help="Waktu resume, nota yang dulu error nggak dicoba lagi")
+    parser.add_argument("--profile", help="Profile inference (fp32, bf16, int8, int8-compiled, ...)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Jumlah proses preprocessing")
+    parser.add_argument("--batch-size", type=int, default=4, help="Jumlah gambar per panggilan run_batch")
+    run(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
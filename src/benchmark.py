@@ -0,0 +1,286 @@
+"""
+Benchmark latency per stage pipeline preprocessing + model.
+
+    python src/benchmark.py                               # data/, stub model (offline)
+    python src/benchmark.py foto/ --engine donut --repeat 5
+    python src/benchmark.py --save-baseline bench/baseline.json
+    python src/benchmark.py --baseline bench/baseline.json --fail-on-regression
+    python src/benchmark.py --engine donut --compare-profiles fp32,int8,bf16
+    python src/benchmark.py --compare-parsers rules,stub                  # offline
+    python src/benchmark.py --engine florence --compare-parsers router,local,rules --labels labels.json
+
+Laporan berisi persentil latency (ms) per stage (preprocessing + stage
+AIModel: preprocess, inference, postprocessing, parse, formatting) dan peak RSS proses.
+"""
+import argparse
+import difflib
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+# --- PATH SETUP ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+
+model_dir = os.path.join(current_dir, "model")
+if model_dir not in sys.path:
+    sys.path.append(model_dir)
+
+from src.batch import iter_inputs
+from src.model.registry import ENGINES, load_engine
+from base import StageHook
+from src.utility.parser_backends import PARSER_BACKENDS, load_parser_backend
+from src.utility.parsing import reconciles_receipt
+from src.utility.preprocessing import ImagePreprocessor
+
+DEFAULT_DATA_DIR = os.path.join(root_dir, "data")
+# Selisih di bawah ini dianggap noise, bukan regresi
+NOISE_FLOOR_MS = 1.0
+
+class SampleHook(StageHook):
+    """Kumpulin durasi stage model ke `samples`."""
+    def __init__(self, samples):
+        self.samples = samples
+
+    def on_stage(self, model, stage, seconds, info):
+        self.samples[f"model.{stage}"].append(seconds)
+
+def peak_rss_mb() -> float:
+    # Linux: ru_maxrss dalam KB, macOS: dalam byte
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def summarize(values) -> dict:
+    ms = np.asarray(values) * 1000
+    return {
+        "count": int(ms.size),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+def collect_paths(sources):
+    paths = [path for source in sources for _, path in iter_inputs(source)]
+    if not paths:
+        raise SystemExit("Tidak ada gambar untuk di-benchmark.")
+    return paths
+
+def run_benchmark(sources, engine: str, repeat: int, profile: str = None) -> dict:
+    paths = collect_paths(sources)
+
+    samples = defaultdict(list)
+    model = load_engine(engine, profile=profile)
+    model.add_hook(SampleHook(samples))
+
+    for _ in range(repeat):
+        for path in paths:
+            timings = {}
+            image = ImagePreprocessor.process_image(path, timings=timings)
+            for stage, seconds in timings.items():
+                samples[f"preprocess.{stage}"].append(seconds)
+
+            start = time.perf_counter()
+            model.run(image)
+            samples["model.run"].append(time.perf_counter() - start)
+
+    return {
+        "meta": {"engine": engine, "profile": profile, "images": len(paths), "repeat": repeat},
+        "stages": {stage: summarize(values) for stage, values in sorted(samples.items())},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def decode_texts(model, images):
+    """Raw OCR text per gambar + durasi decode (tanpa LLM, supaya yang dibandingkan murni vision model)."""
+    texts, seconds = [], []
+    for image in images:
+        start = time.perf_counter()
+        output = model._inference(model._preprocess(image))
+        texts.append(str(model._postprocessing(output, image)))
+        seconds.append(time.perf_counter() - start)
+    return texts, seconds
+
+def compare_profiles(sources, engine: str, profiles) -> dict:
+    """
+    Jalankan tiap profile di gambar yang sama dan bandingkan raw OCR text-nya
+    dengan profile pertama (referensi, biasanya fp32).
+    """
+    paths = collect_paths(sources)
+    images = [ImagePreprocessor.process_image(path) for path in paths]
+
+    results = {}
+    reference = None
+    for profile in profiles:
+        model = load_engine(engine, profile=profile)
+        texts, seconds = decode_texts(model, images)
+        del model
+
+        if reference is None:
+            reference = texts
+        similarity = [difflib.SequenceMatcher(None, ref, text).ratio() for ref, text in zip(reference, texts)]
+        results[profile] = {
+            "decode": summarize(seconds),
+            "text_similarity": round(float(np.mean(similarity)), 4),
+            "exact_match": round(sum(ref == text for ref, text in zip(reference, texts)) / len(texts), 4),
+        }
+
+    base = results[profiles[0]]["decode"]["p50_ms"]
+    print(f"Engine: {engine}, {len(paths)} gambar, referensi: {profiles[0]}")
+    print(f"\n{'profile':16s} {'p50 ms':>9s} {'speedup':>8s} {'similarity':>11s} {'exact':>7s}")
+    for profile, result in results.items():
+        p50 = result["decode"]["p50_ms"]
+        print(f"{profile:16s} {p50:9.1f} {base / p50 if p50 else 0:7.2f}x {result['text_similarity']:11.2%} {result['exact_match']:7.0%}")
+    return {"meta": {"engine": engine, "images": len(paths), "reference": profiles[0]}, "profiles": results}
+
+def price_f1(reference: dict, result: dict) -> float:
+    """F1 multiset harga item (dibulatkan ke rupiah) terhadap referensi."""
+    ref = [round(float(item.get("price") or 0)) for item in reference.get("items") or []]
+    got = [round(float(item.get("price") or 0)) for item in result.get("items") or []]
+    if not ref and not got:
+        return 1.0
+    remaining = list(ref)
+    matched = 0
+    for price in got:
+        if price in remaining:
+            remaining.remove(price)
+            matched += 1
+    if not matched:
+        return 0.0
+    precision, recall = matched / len(got), matched / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+def compare_parsers(sources, engine: str, backends, labels_path: str = None) -> dict:
+    """
+    Jalankan tiap parser backend di raw OCR text yang sama (tanpa fast-path & cache respons).
+    Akurasi dibandingkan dengan label ({nama file: {"items", "total"}}) kalau ada,
+    kalau nggak dengan backend pertama.
+    """
+    paths = collect_paths(sources)
+    images = [ImagePreprocessor.process_image(path) for path in paths]
+    texts, _ = decode_texts(load_engine(engine), images)
+
+    labels = None
+    if labels_path:
+        with open(labels_path) as f:
+            labels = json.load(f)
+
+    outputs = {}
+    results = {}
+    for name in backends:
+        kwargs = {"use_cache": False} if name in ("router", "local") else {}
+        backend = load_parser_backend(name, **kwargs)
+        parsed, seconds = [], []
+        for text in texts:
+            start = time.perf_counter()
+            parsed.append(backend.parse(text))
+            seconds.append(time.perf_counter() - start)
+        outputs[name] = parsed
+
+        if labels is not None:
+            reference = [labels.get(os.path.basename(path), {"items": [], "total": 0}) for path in paths]
+        else:
+            reference = outputs[backends[0]]
+        total_match = [
+            abs(float(res.get("total") or 0) - float(ref.get("total") or 0)) <= 0.01 * max(float(ref.get("total") or 0), 1)
+            for ref, res in zip(reference, parsed)
+        ]
+        results[name] = {
+            "parse": summarize(seconds),
+            "total_match": round(sum(total_match) / len(parsed), 4),
+            "price_f1": round(float(np.mean([price_f1(ref, res) for ref, res in zip(reference, parsed)])), 4),
+            "reconciled": round(sum(reconciles_receipt(res.get("items"), res.get("total"), res.get("subtotal")) for res in parsed) / len(parsed), 4),
+        }
+
+    reference_name = "labels" if labels is not None else backends[0]
+    print(f"Engine: {engine}, {len(paths)} gambar, referensi: {reference_name}")
+    print(f"\n{'backend':10s} {'p50 ms':>9s} {'p90 ms':>9s} {'total ok':>9s} {'price F1':>9s} {'reconcile':>10s}")
+    for name, result in results.items():
+        stats = result["parse"]
+        print(f"{name:10s} {stats['p50_ms']:9.1f} {stats['p90_ms']:9.1f} {result['total_match']:9.0%} "
+              f"{result['price_f1']:9.2f} {result['reconciled']:10.0%}")
+    return {"meta": {"engine": engine, "images": len(paths), "reference": reference_name}, "parsers": results}
+
+def compare(report: dict, baseline: dict, threshold: float):
+    """Print diff terhadap baseline, return daftar stage yang regresi."""
+    regressions = []
+    print(f"\n{'stage':40s} {'base p50':>10s} {'p50':>10s} {'delta':>8s}")
+    for stage, stats in report["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if old is None:
+            print(f"{stage:40s} {'-':>10s} {stats['p50_ms']:10.2f} {'new':>8s}")
+            continue
+        delta = stats["p50_ms"] - old["p50_ms"]
+        ratio = delta / old["p50_ms"] if old["p50_ms"] else 0.0
+        flag = ""
+        if ratio > threshold and delta > NOISE_FLOOR_MS:
+            regressions.append(stage)
+            flag = "  <-- REGRESI"
+        print(f"{stage:40s} {old['p50_ms']:10.2f} {stats['p50_ms']:10.2f} {ratio:+8.1%}{flag}")
+
+    old_rss = baseline.get("peak_rss_mb")
+    if old_rss:
+        print(f"{'peak_rss_mb':40s} {old_rss:10.1f} {report['peak_rss_mb']:10.1f} {(report['peak_rss_mb'] - old_rss) / old_rss:+8.1%}")
+    return regressions
+
+def print_report(report: dict):
+    meta = report["meta"]
+    print(f"Engine: {meta['engine']}, {meta['images']} gambar x {meta['repeat']} repeat")
+    print(f"\n{'stage':40s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}  (ms)")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:40s} {stats['p50_ms']:9.2f} {stats['p90_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['max_ms']:9.2f}")
+    print(f"\nPeak RSS: {report['peak_rss_mb']:.1f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pipeline OCR nota.")
+    parser.add_argument("sources", nargs="*", default=[DEFAULT_DATA_DIR], help="Folder gambar / manifest")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="stub", help="'stub' jalan offline tanpa weights")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--profile", help="Profile inference engine (fp32, bf16, int8, ...)")
+    parser.add_argument("--compare-profiles", help="Daftar profile dipisah koma; yang pertama jadi referensi akurasi")
+    parser.add_argument("--compare-parsers", help=f"Daftar parser backend dipisah koma ({', '.join(PARSER_BACKENDS)})")
+    parser.add_argument("--labels", help="JSON {nama file: {items, total}} sebagai referensi akurasi --compare-parsers")
+    parser.add_argument("--output", help="Simpan laporan JSON ke file ini")
+    parser.add_argument("--save-baseline", help="Simpan laporan sebagai baseline JSON")
+    parser.add_argument("--baseline", help="Bandingkan dengan baseline JSON ini")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Batas kenaikan p50 (relatif) sebelum dianggap regresi")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.compare_profiles or args.compare_parsers:
+        if args.compare_profiles:
+            report = compare_profiles(args.sources, args.engine, args.compare_profiles.split(","))
+        else:
+            report = compare_parsers(args.sources, args.engine, args.compare_parsers.split(","), args.labels)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+        return
+
+    report = run_benchmark(args.sources, args.engine, args.repeat, args.profile)
+    print_report(report)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,26 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Dict
+from typing import Callable, Dict, List, Optional
 from PIL import Image
 
-@dataclass
+from src.utility.jobs import JobCancelled
+from src.utility.parsing import parse_receipts, stitch_texts
+from src.utility.preprocessing import ImagePreprocessor
+
+# Versi format to_bytes/from_bytes; naikkan kalau strukturnya berubah
+RECEIPT_FORMAT_VERSION = 2
+
+def stable_item_id(name: str, total_price: float) -> int:
+    """ID dari isi item (bukan hash() Python yang di-salt per proses), sama di semua worker & restart."""
+    digest = hashlib.blake2b(f"{name}|{float(total_price)!r}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+@dataclass(slots=True)
 class ItemData:
     name: str
     count: int
@@ -11,14 +28,302 @@ class ItemData:
     id: int = field(init=False) 
 
     def __post_init__(self):
-        self.id = abs(hash(self.name + str(self.total_price)))
+        self.id = stable_item_id(self.name, self.total_price)
 
-@dataclass
+@dataclass(slots=True)
 class ReceiptData:
     items: Dict[int, ItemData]
     total: float
+    # Info tambahan per scan (jalur decoding, tier cascade, ...), bukan isi nota
+    meta: dict = field(default_factory=dict)
+    # Sebelum pajak/service; None kalau nota nggak mencantumkan (atau nggak kebaca)
+    subtotal: Optional[float] = None
+
+    def to_bytes(self) -> bytes:
+        """JSON ringkas + versi format. ID item nggak disimpan, dihitung ulang dari isinya."""
+        return json.dumps({
+            "v": RECEIPT_FORMAT_VERSION,
+            "items": [[it.name, it.count, it.total_price] for it in self.items.values()],
+            "subtotal": self.subtotal,
+            "total": self.total,
+            "meta": self.meta,
+        }, separators=(",", ":"), ensure_ascii=False).encode()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "ReceiptData":
+        data = json.loads(blob)
+        if data.get("v") != RECEIPT_FORMAT_VERSION:
+            raise ValueError(f"Format ReceiptData tidak dikenal: v{data.get('v')}")
+        items = [ItemData(name=name, count=count, total_price=price) for name, count, price in data["items"]]
+        return cls(items={it.id: it for it in items}, total=data["total"], meta=data.get("meta", {}),
+                   subtotal=data.get("subtotal"))
+
+def check_stop(should_stop: Optional[Callable[[], bool]]):
+    """Raise JobCancelled kalau `should_stop()` True; dipanggil di antara stage yang mahal."""
+    if should_stop is not None and should_stop():
+        raise JobCancelled()
+
+class StageHook:
+    """
+    Dipanggil setiap stage pipeline AIModel selesai.
+    `info` berisi data tambahan stage (resolution, batch_size, tokens, ...).
+    """
+    def on_stage(self, model: "AIModel", stage: str, seconds: float, info: dict):
+        pass
+
+class ScanStream:
+    """
+    Hasil AIModel.run_stream. Di-iterasi: potongan teks OCR selama vision decoder
+    jalan (generate di worker thread). result(): parse + formatting, langsung
+    setelah decoding selesai. `should_stop` ikut dicek di dalam generate
+    (StoppingCriteria), jadi scan yang dibatalkan nggak decode sampai habis.
+    """
+    def __init__(self, model: "AIModel" = None, image: Image.Image = None, receipt: ReceiptData = None,
+                 should_stop: Optional[Callable[[], bool]] = None):
+        self.model = model
+        self.image = image
+        self.should_stop = should_stop
+        self._receipt = receipt
+        self._done = receipt is not None
+        self._inputs = None
+        self._output = None
+        self._callbacks = []
+
+    @classmethod
+    def completed(cls, receipt: ReceiptData) -> "ScanStream":
+        """Stream yang hasilnya sudah ada (misal dari cache), iterasinya kosong."""
+        return cls(receipt=receipt)
+
+    def on_result(self, callback):
+        self._callbacks.append(callback)
+
+    def __iter__(self):
+        if self._done:
+            return
+        model = self.model
+        images = [self.image]
+        self._inputs = model._stage(
+            "preprocess", model._preprocess, images if model.batched else self.image, info=image_info(images)
+        )
+
+        check_stop(self.should_stop)
+        stop_kwargs = model._stop_kwargs(self.should_stop)
+        streamer = model._make_streamer()
+        if streamer is None:
+            self._output = model._stage("inference", lambda inputs: model._inference(inputs, **stop_kwargs), self._inputs)
+            check_stop(self.should_stop)
+            self._done = True
+            return
+
+        errors = []
+        elapsed = []
+
+        def generate():
+            # Stage dilaporkan dari thread pemanggil setelah join, supaya hook yang
+            # pakai thread-local (TraceHook) melihat satu scan sebagai satu trace
+            start = time.perf_counter()
+            try:
+                self._output = model._inference(self._inputs, streamer, **stop_kwargs)
+                elapsed.append(time.perf_counter() - start)
+            except Exception as e:
+                errors.append(e)
+                # Supaya loop di bawah nggak nunggu selamanya
+                streamer.end()
+
+        worker = threading.Thread(target=generate, name="scan-stream", daemon=True)
+        worker.start()
+        for text in streamer:
+            if text:
+                yield text
+        worker.join()
+        if errors:
+            raise errors[0]
+        check_stop(self.should_stop)
+        model._report("inference", elapsed[0], self._output)
+        self._done = True
+
+    def result(self) -> ReceiptData:
+        if self._receipt is None:
+            if not self._done:
+                for _ in self:
+                    pass
+            self._receipt = self.model._complete(self._inputs, self._output, [self.image], self.should_stop)[0]
+            for callback in self._callbacks:
+                callback(self._receipt)
+        return self._receipt
 
 class AIModel(ABC):
-    @abstractmethod
+    """
+    Template pipeline: _preprocess -> _inference -> _postprocessing -> parse -> _formatting.
+    Engine cukup implement 3 stage pertama; setiap stage dilaporkan ke hooks.
+    """
+    name = "base"
+    # Engine yang bisa proses list gambar sekaligus set True dan implement _postprocessing_batch
+    batched = False
+    hooks = ()
+    # (width, height) input vision encoder, dipakai untuk rasio strip tiling
+    input_size = None
+    # Engine yang _inference-nya terima `should_stop` (dipasang sebagai StoppingCriteria generate)
+    cancellable = False
+
     def run(self, image: Image.Image) -> ReceiptData:
-        pass
\ No newline at end of file
+        images = [image]
+        inputs = self._stage("preprocess", self._preprocess, images if self.batched else image, info=image_info(images))
+        output = self._stage("inference", self._inference, inputs)
+        return self._complete(inputs, output, images)[0]
+
+    def run_batch(self, images: List[Image.Image]) -> List[ReceiptData]:
+        if not self.batched:
+            return [self.run(image) for image in images]
+        if not images:
+            return []
+        inputs = self._stage("preprocess", self._preprocess, images, info=image_info(images))
+        output = self._stage("inference", self._inference, inputs)
+        return self._complete(inputs, output, images)
+
+    def run_stream(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> "ScanStream":
+        """Seperti run, tapi teks OCR bisa dibaca sambil decoding jalan (lihat ScanStream)."""
+        return ScanStream(self, image, should_stop=should_stop)
+
+    def run_tiled(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> ReceiptData:
+        """
+        Untuk nota panjang: potong jadi strip overlap (rasio = input model),
+        decode semua strip sekaligus, gabung teksnya, baru parse sekali.
+        `should_stop()` True -> JobCancelled (dicek di dalam generate dan antar stage).
+        """
+        tiles = self.strips(image)
+        check_stop(should_stop)
+        if len(tiles) == 1:
+            return self.run(image)
+
+        stop_kwargs = self._stop_kwargs(should_stop)
+        if self.batched:
+            inputs = self._stage("preprocess", self._preprocess, tiles, info=image_info(tiles))
+            output = self._stage("inference", lambda inputs: self._inference(inputs, **stop_kwargs), inputs)
+            check_stop(should_stop)
+            raw_texts = self._stage("postprocessing", self._postprocessing_batch, output, tiles)
+        else:
+            with ThreadPoolExecutor(max_workers=len(tiles)) as pool:
+                raw_texts = list(pool.map(lambda tile: self._decode_tile(tile, should_stop), tiles))
+
+        check_stop(should_stop)
+        raw_text = self._stage("stitch", self._stitch, raw_texts)
+        json_list = self._stage("parse", parse_receipts, [raw_text])
+        receipt = self._stage("formatting", self._formatting, json_list[0])
+        receipt.meta["tiles"] = len(tiles)
+        return receipt
+
+    def strips(self, image: Image.Image) -> List[Image.Image]:
+        """Strip untuk run_tiled; nota yang nggak kepanjangan cuma [image]."""
+        strip_aspect = self.input_size[1] / self.input_size[0] if self.input_size else 1.0
+        return ImagePreprocessor.split_into_strips(image, strip_aspect=strip_aspect)
+
+    def _decode_tile(self, tile: Image.Image, should_stop: Optional[Callable[[], bool]] = None):
+        check_stop(should_stop)
+        stop_kwargs = self._stop_kwargs(should_stop)
+        inputs = self._stage("preprocess", self._preprocess, tile, info=image_info([tile]))
+        output = self._stage("inference", lambda inputs: self._inference(inputs, **stop_kwargs), inputs)
+        check_stop(should_stop)
+        return self._stage("postprocessing", self._postprocessing, output, tile)
+
+    def _stitch(self, raw_texts: List) -> str:
+        """Gabung output postprocessing per strip, overlap dibuang."""
+        return stitch_texts([str(text) for text in raw_texts])
+
+    def _complete(self, inputs, output, images: List[Image.Image],
+                  should_stop: Optional[Callable[[], bool]] = None) -> List[ReceiptData]:
+        """Sisa pipeline setelah inference: postprocessing -> parse -> formatting."""
+        if self.batched:
+            raw_texts = self._stage("postprocessing", self._postprocessing_batch, output, images)
+        else:
+            raw_texts = [self._stage("postprocessing", self._postprocessing, output, images[0])]
+        # Parse bisa round trip ke LLM, jangan dikerjakan kalau scan sudah dibatalkan
+        check_stop(should_stop)
+        json_list = self._stage("parse", parse_receipts, raw_texts)
+        return self._stage("formatting", lambda items: [self._formatting(j) for j in items], json_list)
+
+    def _stop_kwargs(self, should_stop) -> dict:
+        """Argumen tambahan _inference untuk engine yang bisa berhenti di tengah generate."""
+        return {"should_stop": should_stop} if should_stop is not None and self.cancellable else {}
+
+    def _make_streamer(self):
+        """Engine yang bisa streaming return TextIteratorStreamer; _inference dapat streamer sebagai argumen kedua."""
+        return None
+
+    def generation_settings(self) -> dict:
+        """Semua setting yang mempengaruhi hasil scan (dipakai buat cache key)."""
+        return {}
+
+    def add_hook(self, hook: StageHook):
+        self.hooks = (*self.hooks, hook)
+
+    def _stage(self, stage: str, fn, *args, info=None):
+        start = time.perf_counter()
+        result = fn(*args)
+        self._report(stage, time.perf_counter() - start, result, info)
+        return result
+
+    def _report(self, stage: str, seconds: float, result, info=None):
+        """Kirim stage yang sudah selesai ke hooks (dipanggil _stage, atau langsung kalau stage jalan di thread lain)."""
+        if self.hooks:
+            info = {**(info or {}), **self._stage_info(stage, result)}
+            for hook in self.hooks:
+                hook.on_stage(self, stage, seconds, info)
+
+    def _stage_info(self, stage: str, result) -> dict:
+        """Override untuk info tambahan per stage, misal jumlah token hasil inference."""
+        return {}
+
+    @abstractmethod
+    def _preprocess(self, image):
+        pass
+
+    @abstractmethod
+    def _inference(self, inputs):
+        pass
+
+    @abstractmethod
+    def _postprocessing(self, output, image) -> str:
+        pass
+
+    @abstractmethod
+    def _postprocessing_batch(self, output, images: List[Image.Image]) -> List[str]:
+        pass
+
+    def _formatting(self, json_data: dict) -> ReceiptData:
+        try:
+            raw_items = json_data.get("items", [])
+            items = []
+            
+            for item in raw_items:
+                name = item.get("name", "Unknown")
+                
+                qty = item.get("qty")
+                if qty is None: qty = 1
+                
+                price = item.get("price", 0)
+                
+                items.append(ItemData(
+                    name=str(name),
+                    count=int(qty),
+                    total_price=float(price)
+                ))
+            
+            total_val = float(json_data.get("total", 0))
+            subtotal = json_data.get("subtotal")
+            
+            return ReceiptData(
+                items={it.id: it for it in items},
+                total=total_val,
+                subtotal=float(subtotal) if subtotal else None,
+            )
+            
+        except Exception as e:
+            print(f"Formatting Error: {e}")
+            return ReceiptData(items={}, total=0.0)
+
+def image_info(images: List[Image.Image]) -> dict:
+    return {
+        "batch_size": len(images),
+        "resolution": [(image.width, image.height) for image in images],
+    }
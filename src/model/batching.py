@@ -0,0 +1,94 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from PIL import Image
+
+from base import AIModel, ReceiptData
+
+class BatcherClosed(RuntimeError):
+    """Job masuk (atau masih antre) waktu MicroBatcher ditutup."""
+
+class MicroBatcher:
+    """
+    Kumpulin request run() dari banyak thread, lalu dispatch ke model.run_batch
+    begitu ada `max_batch_size` gambar atau sudah nunggu `max_wait_ms`.
+    """
+    def __init__(self, model: AIModel, max_batch_size: int = 4, max_wait_ms: float = 50):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        # Cek _closed + put harus atomik, kalau nggak job bisa masuk setelah sentinel dan nggak pernah dilayani
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, image: Image.Image) -> Future:
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise BatcherClosed("MicroBatcher sudah ditutup.")
+            self._queue.put((image, future))
+        return future
+
+    def run(self, image: Image.Image) -> ReceiptData:
+        return self.submit(image).result()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        # close() bisa dipanggil dari worker sendiri (misal evict saat tier cascade di-load);
+        # worker lanjut sampai sentinel, jadi antrean nggak perlu dikuras di sini
+        if threading.current_thread() is self._worker:
+            return
+        self._worker.join()
+        # Jaga-jaga: job yang masih tersisa setelah worker berhenti digagalkan, jangan digantung
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None and job[1].set_running_or_notify_cancel():
+                job[1].set_exception(BatcherClosed("MicroBatcher ditutup sebelum job dijalankan."))
+
+    def _collect(self, first) -> List:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                self._queue.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            batch = [j for j in self._collect(job) if j[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.model.run_batch([image for image, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
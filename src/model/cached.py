@@ -0,0 +1,91 @@
+import hashlib
+import json
+from typing import Callable, List, Optional
+
+from PIL import Image
+
+from base import RECEIPT_FORMAT_VERSION, AIModel, ReceiptData, ScanStream
+from src.utility.cache import image_digest
+
+class CachedModel(AIModel):
+    """
+    Bungkus AIModel dengan DiskCache. Key = hash pixel hasil preprocess
+    + nama engine + generation settings, jadi foto yang sama nggak di-decode ulang.
+    """
+    def __init__(self, model: AIModel, cache):
+        self.model = model
+        self.cache = cache
+        self.name = model.name
+        self.input_size = model.input_size
+
+    def generation_settings(self) -> dict:
+        return self.model.generation_settings()
+
+    def add_hook(self, hook):
+        self.model.add_hook(hook)
+
+    def strips(self, image: Image.Image) -> List[Image.Image]:
+        return self.model.strips(image)
+
+    # Dipakai warm-up (registry / cascade), nggak lewat cache
+    def _preprocess(self, image):
+        return self.model._preprocess(image)
+
+    def _inference(self, inputs):
+        return self.model._inference(inputs)
+
+    def _postprocessing(self, output, image):
+        return self.model._postprocessing(output, image)
+
+    def _postprocessing_batch(self, output, images):
+        return self.model._postprocessing_batch(output, images)
+
+    def cache_key(self, image: Image.Image, variant: str = "") -> str:
+        settings = json.dumps(self.generation_settings(), sort_keys=True, default=str)
+        # Versi format ikut di key: entry format lama otomatis jadi miss
+        key = f"{image_digest(image)}|{self.name}|{variant}|{settings}|v{RECEIPT_FORMAT_VERSION}"
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def run(self, image: Image.Image) -> ReceiptData:
+        return self.run_batch([image])[0]
+
+    def run_batch(self, images: List[Image.Image]) -> List[ReceiptData]:
+        keys = [self.cache_key(image) for image in images]
+        results: List[Optional[ReceiptData]] = []
+        for key in keys:
+            blob = self.cache.get(key)
+            results.append(ReceiptData.from_bytes(blob) if blob is not None else None)
+
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            fresh = self.model.run_batch([images[i] for i in missing])
+            for i, receipt in zip(missing, fresh):
+                results[i] = receipt
+                # Hasil kosong (LLM gagal / token belum diset) jangan di-cache
+                if receipt.items:
+                    self.cache.set(keys[i], receipt.to_bytes())
+        return results
+
+    def run_tiled(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> ReceiptData:
+        key = self.cache_key(image, variant="tiled")
+        blob = self.cache.get(key)
+        if blob is not None:
+            return ReceiptData.from_bytes(blob)
+        receipt = self.model.run_tiled(image, should_stop)
+        if receipt.items:
+            self.cache.set(key, receipt.to_bytes())
+        return receipt
+
+    def run_stream(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> ScanStream:
+        key = self.cache_key(image)
+        blob = self.cache.get(key)
+        if blob is not None:
+            return ScanStream.completed(ReceiptData.from_bytes(blob))
+
+        def store(receipt):
+            if receipt.items:
+                self.cache.set(key, receipt.to_bytes())
+
+        stream = self.model.run_stream(image, should_stop)
+        stream.on_result(store)
+        return stream
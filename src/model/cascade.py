@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import Counter
+from typing import Callable, List, Optional
+
+from PIL import Image
+
+from base import AIModel, ReceiptData, ScanStream, check_stop
+from .registry import load_engine
+from ..utility.parsing import reconciles_receipt
+
+# Urutan tier dari yang paling murah; tier berikutnya cuma jalan kalau hasil sebelumnya ditolak
+CASCADE_TIERS = [name.strip() for name in os.getenv("OCR_CASCADE", "donut,florence").split(",") if name.strip()]
+# Harga satu baris item di atas ini hampir pasti salah baca (digit nyambung, nomor struk, ...)
+MAX_ITEM_PRICE = float(os.getenv("OCR_CASCADE_MAX_PRICE", 10_000_000))
+
+def validate_receipt(receipt: ReceiptData) -> Optional[str]:
+    """Alasan hasil scan ditolak, atau None kalau lolos."""
+    if not receipt.items:
+        return "no_items"
+    if not receipt.total or receipt.total <= 0:
+        return "no_total"
+    for item in receipt.items.values():
+        if item.count <= 0 or item.total_price <= 0 or item.total_price > MAX_ITEM_PRICE:
+            return "implausible_price"
+        if item.total_price > receipt.total:
+            return "implausible_price"
+    # Total sudah termasuk pajak/service: cocokkan dengan subtotal, atau dalam toleransi pajak
+    items = [{"price": item.total_price} for item in receipt.items.values()]
+    if not reconciles_receipt(items, receipt.total, receipt.subtotal):
+        return "not_reconciled"
+    return None
+
+class CascadeModel(AIModel):
+    """
+    Engine murah dulu, engine berat cuma kalau hasilnya nggak lolos `validator`
+    (item kosong, jumlah item != total, harga nggak masuk akal).
+    Tier yang melayani dicatat di receipt.meta["cascade"].
+    `loader` (nama -> AIModel) dipanggil saat tier pertama kali dibutuhkan.
+    """
+    name = "cascade"
+
+    def __init__(self, tiers: Optional[List[str]] = None, loader: Optional[Callable] = None,
+                 validator: Callable = validate_receipt, profile=None):
+        self.tier_names = list(tiers or CASCADE_TIERS)
+        self.validator = validator
+        self.served = Counter()
+        self._models = {}
+        self._lock = threading.Lock()
+        # Loader dari ModelRegistry nggak di-memo di sini, supaya tier bisa di-evict oleh registry
+        self.loader = loader or (lambda name: self._load_own(name, profile))
+        self.input_size = self.tier(0).input_size
+
+    def _load_own(self, name: str, profile):
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = load_engine(name, profile=profile)
+            return self._models[name]
+
+    def tier(self, index: int) -> AIModel:
+        return self.loader(self.tier_names[index])
+
+    def generation_settings(self) -> dict:
+        # Tier berat belum tentu sudah di-load, jadi cukup nama tier + validator
+        return {"tiers": self.tier_names, "validator": self.validator.__name__, "max_item_price": MAX_ITEM_PRICE}
+
+    def run(self, image: Image.Image) -> ReceiptData:
+        return self.run_batch([image])[0]
+
+    def run_batch(self, images: List[Image.Image]) -> List[ReceiptData]:
+        if not images:
+            return []
+        receipts = self.tier(0).run_batch(images)
+        return self._escalate(images, receipts, lambda model, subset: model.run_batch(subset))
+
+    def run_tiled(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> ReceiptData:
+        receipt = self.tier(0).run_tiled(image, should_stop)
+        return self._escalate(
+            [image], [receipt], lambda model, subset: [model.run_tiled(subset[0], should_stop)], should_stop=should_stop
+        )[0]
+
+    def run_stream(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> ScanStream:
+        return CascadeStream(self, image, should_stop)
+
+    def strips(self, image: Image.Image) -> List[Image.Image]:
+        return self.tier(0).strips(image)
+
+    def _escalate(self, images, receipts, runner, start: int = 0, should_stop=None) -> List[ReceiptData]:
+        """Validasi hasil tier `start`, yang ditolak dijalankan ulang (per batch) di tier berikutnya."""
+        receipts = list(receipts)
+        served = [start] * len(receipts)
+        rejected = [[] for _ in receipts]
+        pending = list(range(len(receipts)))
+
+        for index in range(start, len(self.tier_names)):
+            if index > start:
+                check_stop(should_stop)
+                fresh = runner(self.tier(index), [images[i] for i in pending])
+                for i, receipt in zip(pending, fresh):
+                    # Tier berat yang hasilnya kosong nggak boleh nimpa hasil tier murah yang ada itemnya
+                    if receipt.items or not receipts[i].items:
+                        receipts[i] = receipt
+                        served[i] = index
+            name = self.tier_names[index]
+            reasons = self._stage(
+                "validate", lambda: [self.validator(receipts[i]) for i in pending],
+                info={"tier": name, "batch_size": len(pending)},
+            )
+            for i, reason in zip(pending, reasons):
+                if reason:
+                    rejected[i].append({"tier": name, "reason": reason})
+            pending = [i for i, reason in zip(pending, reasons) if reason]
+            if not pending:
+                break
+
+        for receipt, index, reasons in zip(receipts, served, rejected):
+            name = self.tier_names[index]
+            self.served[name] += 1
+            receipt.meta["cascade"] = {"tier": name, "rejected": reasons}
+        return receipts
+
+    def _stage_info(self, stage, result) -> dict:
+        if stage != "validate":
+            return {}
+        return {"rejected": sum(1 for reason in result if reason)}
+
+    # Warm-up registry cukup panasin tier pertama
+    def _preprocess(self, image):
+        return self.tier(0)._preprocess(image)
+
+    def _inference(self, inputs):
+        return self.tier(0)._inference(inputs)
+
+    def _postprocessing(self, output, image):
+        return self.tier(0)._postprocessing(output, image)
+
+    def _postprocessing_batch(self, output, images):
+        return self.tier(0)._postprocessing_batch(output, images)
+
+class CascadeStream(ScanStream):
+    """Streaming teks dari tier pertama; result() fallback ke tier berikutnya kalau ditolak."""
+    def __init__(self, cascade: CascadeModel, image: Image.Image, should_stop=None):
+        super().__init__(cascade, image, should_stop=should_stop)
+        self._first = cascade.tier(0).run_stream(image, should_stop)
+
+    def __iter__(self):
+        return iter(self._first)
+
+    def result(self) -> ReceiptData:
+        if self._receipt is None:
+            receipt = self._first.result()
+            # Tier berikutnya lewat run_stream supaya generate-nya juga bisa dihentikan
+            self._receipt = self.model._escalate(
+                [self.image], [receipt], lambda model, subset: [model.run_stream(subset[0], self.should_stop).result()],
+                should_stop=self.should_stop,
+            )[0]
+            for callback in self._callbacks:
+                callback(self._receipt)
+        return self._receipt
@@ -1,79 +1,90 @@
 import torch
-import re
-from PIL import Image
-from transformers import AutoProcessor, AutoModelForVision2Seq
+from transformers import AutoProcessor, AutoModelForVision2Seq, TextIteratorStreamer
 
-from base import AIModel, ItemData, ReceiptData
-from ..utility.parsing import parse_receipt
+from base import AIModel
+from profiles import apply_profile, apply_threads, get_profile, stopping_criteria, torch_dtype
+from ..utility.parser_backends import get_parser_backend
+from ..utility.parsing import cord_to_text, stitch_texts
 
 MODEL_NAME = "naver-clova-ix/donut-base-finetuned-cord-v2"
 
 class DonutModel(AIModel):
-    def __init__(self):
-        print(f"Loading Donut: {MODEL_NAME}...")
-        self.processor = AutoProcessor.from_pretrained(MODEL_NAME)
-        self.model = AutoModelForVision2Seq.from_pretrained(MODEL_NAME)
+    name = "donut"
+    batched = True
+    cancellable = True
+
+    def __init__(self, profile=None):
+        self.profile = get_profile(profile)
+        print(f"Loading Donut: {MODEL_NAME} ({self.profile.name})...")
+        apply_threads(self.profile)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.dtype = torch_dtype(self.profile, self.device)
+
+        self.processor = AutoProcessor.from_pretrained(MODEL_NAME)
+        self.model = AutoModelForVision2Seq.from_pretrained(MODEL_NAME, torch_dtype=self.dtype)
         self.model.to(self.device)
+        self.model = apply_profile(self.model, self.profile, self.device)
+
+        size = self.processor.image_processor.size
+        self.input_size = (size["width"], size["height"])
+
+        # Prompt decoder sama untuk semua nota, cukup tokenize sekali
+        self.decoder_prompt_ids = torch.tensor(
+            self.processor.tokenizer("<s_cord-v2>", add_special_tokens=False).input_ids
+        ).unsqueeze(0).to(self.device)
+
+        self.generation_kwargs = dict(
+            max_length=self.model.decoder.config.max_position_embeddings,
+            use_cache=True,
+            num_beams=1,
+        )
 
-    def run(self, image: Image.Image) -> ReceiptData:
-        decoder_input_ids, pixel_values = self._preprocess(image)
-        generation_output = self._inference(decoder_input_ids, pixel_values)
-        raw_text = self._postprocessing(generation_output)
-        json_data = parse_receipt(raw_text)
-        return self._formatting(json_data)
+    def generation_settings(self) -> dict:
+        return {"model": MODEL_NAME, "parser": get_parser_backend().describe(), "profile": self.profile.name, **self.generation_kwargs}
 
     def _preprocess(self, image): 
-        decoder_input_ids = self.processor.tokenizer(
-            "<s_cord-v2>", add_special_tokens=False
-        ).input_ids
-        decoder_input_ids = torch.tensor(decoder_input_ids).unsqueeze(0).to(self.device)
-        pixel_values = self.processor(image, return_tensors="pt").pixel_values.to(self.device)
+        # processor resize + pad ke ukuran tetap, jadi list gambar langsung ke-stack
+        pixel_values = self.processor(image, return_tensors="pt").pixel_values.to(self.device, self.dtype)
+        decoder_input_ids = self.decoder_prompt_ids.expand(pixel_values.shape[0], -1)
         return decoder_input_ids, pixel_values
 
-    def _inference(self, decoder_input_ids, pixel_values): 
+    def _make_streamer(self):
+        # Tag CORD (<s_nm>, ...) itu special token, jadi yang tampil cuma isinya
+        return TextIteratorStreamer(self.processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    def _inference(self, inputs, streamer=None, should_stop=None): 
+        decoder_input_ids, pixel_values = inputs
         generation_output = self.model.generate(
             pixel_values,
             decoder_input_ids=decoder_input_ids,
-            max_length=self.model.decoder.config.max_position_embeddings,
             pad_token_id=self.processor.tokenizer.pad_token_id,
             eos_token_id=self.processor.tokenizer.eos_token_id,
-            use_cache=True,
-            num_beams=1,
             bad_words_ids=[[self.processor.tokenizer.unk_token_id]],
             return_dict_in_generate=True,
+            streamer=streamer,
+            stopping_criteria=stopping_criteria(should_stop),
+            **self.generation_kwargs,
         )
         return generation_output
 
-    def _postprocessing(self, generation_output):
-        decoded_sequence = self.processor.batch_decode(generation_output.sequences)[0]
+    def _stage_info(self, stage, result) -> dict:
+        if stage != "inference":
+            return {}
+        generated = result.sequences[:, self.decoder_prompt_ids.shape[1]:]
+        return {"tokens": int((generated != self.processor.tokenizer.pad_token_id).sum())}
+
+    def _postprocessing(self, generation_output, image):
+        return self._postprocessing_batch(generation_output, [image])[0]
+
+    def _postprocessing_batch(self, generation_output, images):
+        return [self._decode_sequence(sequence) for sequence in generation_output.sequences]
+
+    def _stitch(self, raw_outputs):
+        # Output Donut berupa dict CORD, jadikan baris teks dulu baru digabung
+        return stitch_texts([cord_to_text(out) if isinstance(out, dict) else str(out) for out in raw_outputs])
+
+    def _decode_sequence(self, sequence):
+        decoded_sequence = self.processor.tokenizer.decode(sequence)
         decoded_sequence = decoded_sequence.replace(self.processor.tokenizer.eos_token, "")
         decoded_sequence = decoded_sequence.replace(self.processor.tokenizer.pad_token, "")
         return self.processor.token2json(decoded_sequence)
-
-    def _formatting(self, json_data: dict) -> ReceiptData:
-        try:
-            raw_items = json_data.get("items", [])
-            items = []
-            
-            for item in raw_items:
-                name = item.get("name", "Unknown")
-                
-                qty = item.get("qty")
-                if qty is None: qty = 1
-                
-                price = item.get("price", 0)
-                
-                items.append(ItemData(
-                    name=str(name),
-                    count=int(qty),
-                    total_price=float(price)
-                ))
-            
-            total_val = float(json_data.get("total", 0))
-            
-            return ReceiptData(items={it.id: it for it in items}, total=total_val)
-            
-        except Exception as e:
-            print(f"Formatting Error: {e}")
-            return ReceiptData(items={}, total=0.0)
\ No newline at end of file
@@ -1,82 +1,249 @@
+import os
 import torch
-from PIL import Image
-from transformers import AutoProcessor, AutoModelForCausalLM
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import List, NamedTuple, Optional
+from transformers import AutoProcessor, AutoModelForCausalLM, LogitsProcessor, LogitsProcessorList, TextIteratorStreamer
 
-from base import AIModel, ItemData, ReceiptData
-from ..utility.parsing import parse_receipt
+from base import AIModel, check_stop, image_info
+from profiles import apply_profile, apply_threads, get_profile, stopping_criteria, torch_dtype
+from ..utility.parser_backends import get_parser_backend
+from ..utility.parsing import parse_receipts, reconciles_receipt
 
 MODEL_NAME = "microsoft/Florence-2-base-ft"
 
+GREEDY = "greedy"
+BEAM = "beam"
+ADAPTIVE = "adaptive"
+
+@dataclass(frozen=True)
+class DecodingConfig:
+    """
+    mode: "adaptive" (greedy + KV cache dulu, beam search kalau hasilnya meragukan),
+    "greedy" atau "beam" (perilaku lama: selalu beam search).
+    """
+    mode: str = os.getenv("FLORENCE_DECODING", ADAPTIVE)
+    max_new_tokens: int = 1024
+    num_beams: int = 3
+    beam_use_cache: bool = False
+    # Rata-rata geometris probabilitas token greedy; di bawah ini -> beam search
+    min_token_confidence: float = float(os.getenv("FLORENCE_MIN_TOKEN_CONFIDENCE", 0.75))
+    # Beam search juga kalau item hasil parse nggak cocok dengan total
+    check_reconcile: bool = True
+
+class Generation(NamedTuple):
+    sequences: torch.Tensor
+    path: str
+    # Per nota, cuma ada untuk greedy
+    confidence: Optional[List[float]] = None
+
+class ConfidenceTracker(LogitsProcessor):
+    """
+    Jumlah logprob token yang dipilih greedy per nota, dihitung tiap step selagi decoding.
+    Pengganti output_scores=True yang nyimpen logits seukuran vocab untuk setiap step.
+    Dipasang paling akhir, jadi argmax di sini = token yang dipilih greedy.
+    """
+    def __init__(self, eos_token_id: int):
+        self.eos_token_id = eos_token_id
+        self.logprob_sum = None
+        self.counts = None
+        self.done = None
+
+    def __call__(self, input_ids, scores):
+        best, tokens = torch.log_softmax(scores.float(), dim=-1).max(dim=-1)
+        best, tokens = best.cpu(), tokens.cpu()
+        if self.logprob_sum is None:
+            self.logprob_sum = torch.zeros(len(best))
+            self.counts = torch.zeros(len(best))
+            self.done = torch.zeros(len(best), dtype=torch.bool)
+        # Token EOS ikut dihitung, padding sesudahnya nggak
+        active = ~self.done
+        self.logprob_sum += torch.where(active, best, torch.zeros_like(best))
+        self.counts += active.float()
+        self.done |= tokens == self.eos_token_id
+        return scores
+
+    def confidence(self, batch_size: int) -> List[float]:
+        """Rata-rata geometris probabilitas token yang dipilih, per nota."""
+        if self.logprob_sum is None:
+            return [0.0] * batch_size
+        return torch.exp(self.logprob_sum / self.counts.clamp(min=1)).tolist()
+
 class FlorenceModel(AIModel):
-    def __init__(self):
-        print(f"Loading Florence: {MODEL_NAME}...")
+    name = "florence"
+    batched = True
+    cancellable = True
+
+    def __init__(self, profile=None, decoding: Optional[DecodingConfig] = None):
+        self.profile = get_profile(profile)
+        print(f"Loading Florence: {MODEL_NAME} ({self.profile.name})...")
+        apply_threads(self.profile)
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.dtype = torch_dtype(self.profile, self.device)
         
         self.model = AutoModelForCausalLM.from_pretrained(
             MODEL_NAME, 
             trust_remote_code=True,
-            torch_dtype=torch.float32, 
+            torch_dtype=self.dtype, 
             device_map=self.device,
             attn_implementation="eager"
         )
+        self.model = apply_profile(self.model, self.profile, self.device)
         self.processor = AutoProcessor.from_pretrained(MODEL_NAME, trust_remote_code=True)
+        size = self.processor.image_processor.size
+        self.input_size = (size["width"], size["height"])
 
-    def run(self, image: Image.Image) -> ReceiptData:
-        inputs = self._preprocess(image)
-        generated_ids = self._inference(inputs)
-        raw_text_result = self._postprocessing(generated_ids, image)
-        
-        json_data = parse_receipt(raw_text_result)
-        
-        return self._formatting(json_data)
+        self.decoding = decoding or DecodingConfig()
+        # Berapa nota yang selesai di greedy vs yang naik ke beam search
+        self.decoding_stats = Counter()
+
+    def generation_settings(self) -> dict:
+        return {"model": MODEL_NAME, "parser": get_parser_backend().describe(), "profile": self.profile.name, **asdict(self.decoding)}
+
+    def _complete(self, inputs, generation, images, should_stop=None):
+        raw_texts = self._stage("postprocessing", self._postprocessing_batch, generation, images)
+        check_stop(should_stop)
+        json_list = self._stage("parse", parse_receipts, raw_texts)
+        paths = [generation.path] * len(images)
+
+        retry = [i for i in range(len(images)) if self._needs_beam(generation, i, json_list[i])]
+        if retry:
+            beam_texts = self._beam(inputs, images, retry, should_stop)
+            for i, json_data in zip(retry, self._stage("parse", parse_receipts, beam_texts)):
+                json_list[i] = json_data
+                paths[i] = f"{GREEDY}->{BEAM}"
+
+        self.decoding_stats.update(paths)
+        receipts = self._stage("formatting", lambda items: [self._formatting(j) for j in items], json_list)
+        for receipt, path in zip(receipts, paths):
+            receipt.meta["decoding"] = path
+        return receipts
+
+    def run_tiled(self, image, should_stop=None):
+        """
+        run_tiled dengan adaptive decoding: strip yang confidence greedy-nya rendah di-decode ulang
+        pakai beam; kalau hasil gabungannya masih nggak cocok dengan total, semua strip sisanya juga.
+        """
+        tiles = self.strips(image)
+        check_stop(should_stop)
+        if len(tiles) == 1:
+            return self.run(image)
+
+        inputs = self._stage("preprocess", self._preprocess, tiles, info=image_info(tiles))
+        generation = self._stage("inference", self._inference, inputs, None, should_stop)
+        check_stop(should_stop)
+        raw_texts = self._stage("postprocessing", self._postprocessing_batch, generation, tiles)
+
+        beamed = [i for i in range(len(tiles)) if self._low_confidence(generation, i)]
+        if beamed:
+            for i, text in zip(beamed, self._beam(inputs, tiles, beamed, should_stop)):
+                raw_texts[i] = text
+
+        check_stop(should_stop)
+        json_data = self._stage("parse", parse_receipts, [self._stage("stitch", self._stitch, raw_texts)])[0]
+
+        # Salah baca bisa di strip mana saja, jadi yang belum di-beam ikut diulang semua
+        rest = [i for i in range(len(tiles)) if i not in beamed]
+        if rest and self._unreconciled(json_data):
+            for i, text in zip(rest, self._beam(inputs, tiles, rest, should_stop)):
+                raw_texts[i] = text
+            beamed += rest
+            check_stop(should_stop)
+            json_data = self._stage("parse", parse_receipts, [self._stage("stitch", self._stitch, raw_texts)])[0]
+
+        path = f"{GREEDY}->{BEAM}" if beamed else generation.path
+        self.decoding_stats.update([path])
+        receipt = self._stage("formatting", self._formatting, json_data)
+        receipt.meta["decoding"] = path
+        receipt.meta["tiles"] = len(tiles)
+        return receipt
+
+    def _beam(self, inputs, images, indices: List[int], should_stop=None) -> List[str]:
+        """Decode ulang gambar `indices` pakai beam search, return teks OCR-nya."""
+        retry_inputs = {key: value[indices] for key, value in inputs.items()}
+        beam = self._stage("inference", self._generate, retry_inputs, BEAM, None, should_stop)
+        check_stop(should_stop)
+        return self._stage("postprocessing", self._postprocessing_batch, beam, [images[i] for i in indices])
+
+    def _needs_beam(self, generation: Generation, index: int, json_data: dict) -> bool:
+        return self._low_confidence(generation, index) or self._unreconciled(json_data)
+
+    def _low_confidence(self, generation: Generation, index: int) -> bool:
+        if self.decoding.mode != ADAPTIVE or generation.confidence is None:
+            return False
+        return generation.confidence[index] < self.decoding.min_token_confidence
+
+    def _unreconciled(self, json_data: dict) -> bool:
+        if self.decoding.mode != ADAPTIVE or not self.decoding.check_reconcile:
+            return False
+        items = json_data.get("items") or []
+        # Parse kosong biasanya masalah LLM/network, beam search nggak bakal bantu.
+        # Total sudah termasuk pajak/service, jadi cocokkan dengan subtotal (atau toleransi pajak)
+        return bool(items) and not reconciles_receipt(items, json_data.get("total"), json_data.get("subtotal"))
 
     def _preprocess(self, image):
-        inputs = self.processor(text="<OCR>", images=image, return_tensors="pt")
-        return inputs.to(self.device)
+        # Prompt <OCR> sama panjang, jadi input_ids & pixel_values bisa ke-stack langsung
+        prompt = ["<OCR>"] * len(image) if isinstance(image, list) else "<OCR>"
+        inputs = self.processor(text=prompt, images=image, return_tensors="pt")
+        # BatchFeature.to cuma cast tensor float (pixel_values), input_ids tetap long
+        return inputs.to(self.device, self.dtype)
 
-    def _inference(self, inputs):
+    def _make_streamer(self):
+        # Streamer cuma jalan untuk greedy; beam search nunggu hasil akhir
+        if self.decoding.mode == BEAM:
+            return None
+        return TextIteratorStreamer(self.processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+
+    def _inference(self, inputs, streamer=None, should_stop=None):
+        return self._generate(inputs, BEAM if self.decoding.mode == BEAM else GREEDY, streamer, should_stop)
+
+    def _generate(self, inputs, path: str, streamer=None, should_stop=None) -> Generation:
+        if path == BEAM:
+            generated_ids = self.model.generate(
+                input_ids=inputs["input_ids"],
+                pixel_values=inputs["pixel_values"],
+                max_new_tokens=self.decoding.max_new_tokens,
+                do_sample=False,
+                num_beams=self.decoding.num_beams,
+                use_cache=self.decoding.beam_use_cache,
+                stopping_criteria=stopping_criteria(should_stop),
+            )
+            return Generation(generated_ids, BEAM)
+
+        tracker = ConfidenceTracker(self.processor.tokenizer.eos_token_id)
         generated_ids = self.model.generate(
             input_ids=inputs["input_ids"],
             pixel_values=inputs["pixel_values"],
-            max_new_tokens=1024,
+            max_new_tokens=self.decoding.max_new_tokens,
             do_sample=False,
-            num_beams=3,
-            use_cache=False 
+            num_beams=1,
+            use_cache=True,
+            logits_processor=LogitsProcessorList([tracker]),
+            streamer=streamer,
+            stopping_criteria=stopping_criteria(should_stop),
         )
-        return generated_ids
+        return Generation(generated_ids, GREEDY, tracker.confidence(len(generated_ids)))
+
+    def _stage_info(self, stage, result) -> dict:
+        if stage != "inference":
+            return {}
+        return {
+            "tokens": int((result.sequences != self.processor.tokenizer.pad_token_id).sum()),
+            "decoding": result.path,
+            "batch_size": len(result.sequences),
+        }
 
-    def _postprocessing(self, generated_ids, image):
-        generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
+    def _postprocessing(self, generation, image):
+        return self._postprocessing_batch(generation, [image])[0]
+
+    def _postprocessing_batch(self, generation, images):
+        generated_texts = self.processor.batch_decode(generation.sequences, skip_special_tokens=False)
+        return [self._parse_generated_text(text, image) for text, image in zip(generated_texts, images)]
+
+    def _parse_generated_text(self, generated_text, image):
         parsed_answer = self.processor.post_process_generation(
             generated_text, 
             task="<OCR>", 
             image_size=(image.width, image.height)
         )
         return parsed_answer.get('<OCR>', '')
-
-    def _formatting(self, json_data: dict) -> ReceiptData:
-        try:
-            raw_items = json_data.get("items", [])
-            items = []
-            
-            for item in raw_items:
-                name = item.get("name", "Unknown")
-                
-                qty = item.get("qty")
-                if qty is None: qty = 1
-                
-                price = item.get("price", 0)
-                
-                items.append(ItemData(
-                    name=str(name),
-                    count=int(qty),
-                    total_price=float(price)
-                ))
-            
-            total_val = float(json_data.get("total", 0))
-            
-            return ReceiptData(items={it.id: it for it in items}, total=total_val)
-            
-        except Exception as e:
-            print(f"Formatting Error: {e}")
-            return ReceiptData(items={}, total=0.0)
\ No newline at end of file
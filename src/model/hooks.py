@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import deque
+
+from base import StageHook
+from src.utility.metrics import REGISTRY
+
+MEGAPIXEL_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 12, 16, 24)
+
+REGISTRY.describe("ocr_stage_seconds", "Durasi tiap stage pipeline AIModel")
+REGISTRY.describe("ocr_generated_tokens_total", "Jumlah token yang di-generate vision decoder")
+REGISTRY.describe("ocr_input_megapixels", "Resolusi gambar yang masuk ke model")
+REGISTRY.describe("ocr_decoding_total", "Jumlah nota per jalur decoding (greedy / beam)")
+REGISTRY.describe("ocr_cascade_validated_total", "Jumlah hasil scan yang divalidasi per tier cascade")
+REGISTRY.describe("ocr_cascade_rejected_total", "Jumlah hasil scan yang ditolak per tier cascade (lanjut ke tier berikutnya)")
+
+class MetricsHook(StageHook):
+    """Kirim durasi stage, token, dan resolusi input ke MetricsRegistry."""
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+
+    def on_stage(self, model, stage, seconds, info):
+        labels = {"engine": model.name}
+        self.registry.observe("ocr_stage_seconds", seconds, {**labels, "stage": stage})
+        if "tokens" in info:
+            self.registry.inc("ocr_generated_tokens_total", info["tokens"], labels)
+        if "decoding" in info:
+            self.registry.inc("ocr_decoding_total", info.get("batch_size", 1), {**labels, "path": info["decoding"]})
+        if "tier" in info:
+            tier = {**labels, "tier": info["tier"]}
+            self.registry.inc("ocr_cascade_validated_total", info.get("batch_size", 1), tier)
+            self.registry.inc("ocr_cascade_rejected_total", info.get("rejected", 0), tier)
+        for width, height in info.get("resolution", ()):
+            self.registry.observe("ocr_input_megapixels", width * height / 1e6, labels, buckets=MEGAPIXEL_BUCKETS)
+
+class TraceHook(StageHook):
+    """Simpan trace beberapa scan terakhir (per stage) buat debug panel."""
+    def __init__(self, maxlen: int = 20):
+        self.traces = deque(maxlen=maxlen)
+        self._current = threading.local()
+
+    def on_stage(self, model, stage, seconds, info):
+        # "preprocess" selalu stage pertama, jadi tanda mulai scan baru
+        if stage == "preprocess" or getattr(self._current, "trace", None) is None:
+            self._current.trace = {"engine": model.name, "started": time.time(), "stages": []}
+            self.traces.append(self._current.trace)
+        self._current.trace["stages"].append({"stage": stage, "ms": round(seconds * 1000, 2), **info})
+
+    def latest(self):
+        return self.traces[-1] if self.traces else None
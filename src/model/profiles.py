@@ -0,0 +1,94 @@
+import os
+from dataclasses import dataclass, asdict, replace
+from typing import Optional
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+# Profile default engine, bisa diganti lewat env (misal OCR_INFERENCE_PROFILE=int8)
+DEFAULT_PROFILE = os.getenv("OCR_INFERENCE_PROFILE", "fp32")
+# Override jumlah thread untuk semua profile (kosong = default torch)
+INTRA_OP_THREADS = os.getenv("OCR_INTRA_OP_THREADS")
+INTER_OP_THREADS = os.getenv("OCR_INTER_OP_THREADS")
+
+@dataclass(frozen=True)
+class InferenceProfile:
+    """Setting inference CPU: dtype, kuantisasi, torch.compile dan jumlah thread."""
+    name: str
+    dtype: str = "fp32"              # "fp32" | "bf16"
+    quantize_int8: bool = False      # dynamic int8 untuk semua nn.Linear (CPU only)
+    compile: bool = False            # torch.compile untuk forward model
+    intra_op_threads: Optional[int] = None
+    inter_op_threads: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+PROFILES = {
+    "fp32": InferenceProfile("fp32"),
+    "bf16": InferenceProfile("bf16", dtype="bf16"),
+    "int8": InferenceProfile("int8", quantize_int8=True),
+    "int8-compiled": InferenceProfile("int8-compiled", quantize_int8=True, compile=True),
+    "fp32-compiled": InferenceProfile("fp32-compiled", compile=True),
+}
+
+def get_profile(profile=None) -> InferenceProfile:
+    if isinstance(profile, InferenceProfile):
+        return profile
+    name = profile or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Profile inference tidak dikenal: {name} (pilihan: {', '.join(PROFILES)})")
+    profile = PROFILES[name]
+    if INTRA_OP_THREADS:
+        profile = replace(profile, intra_op_threads=int(INTRA_OP_THREADS))
+    if INTER_OP_THREADS:
+        profile = replace(profile, inter_op_threads=int(INTER_OP_THREADS))
+    return profile
+
+def bf16_supported() -> bool:
+    """CPU punya instruksi bf16 (AVX512-BF16 / AMX), kalau nggak bf16 malah lebih lambat."""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+def torch_dtype(profile: InferenceProfile, device: str) -> torch.dtype:
+    if profile.dtype == "bf16" and (device != "cpu" or bf16_supported()):
+        return torch.bfloat16
+    if profile.dtype == "bf16":
+        print("bf16 tidak didukung CPU ini, pakai fp32.")
+    return torch.float32
+
+def apply_threads(profile: InferenceProfile):
+    if profile.intra_op_threads:
+        torch.set_num_threads(profile.intra_op_threads)
+    if profile.inter_op_threads:
+        try:
+            torch.set_num_interop_threads(profile.inter_op_threads)
+        except RuntimeError:
+            # Cuma bisa diset sekali sebelum ada kerja paralel
+            print("inter_op_threads sudah terlanjur diset, diabaikan.")
+
+def apply_profile(model: torch.nn.Module, profile: InferenceProfile, device: str) -> torch.nn.Module:
+    """Kuantisasi / compile model yang sudah di-load. Return model yang dipakai untuk generate."""
+    if profile.quantize_int8:
+        if device == "cpu":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            print("Kuantisasi int8 dinamis cuma untuk CPU, dilewati.")
+    if profile.compile:
+        # generate() manggil forward berulang kali, jadi forward yang di-compile
+        model.forward = torch.compile(model.forward, dynamic=True)
+    model.eval()
+    return model
+
+class CancelCriteria(StoppingCriteria):
+    """Hentikan generate begitu `should_stop()` True (misal job scan dibatalkan user)."""
+    def __init__(self, should_stop):
+        self.should_stop = should_stop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), bool(self.should_stop()), dtype=torch.bool, device=input_ids.device)
+
+def stopping_criteria(should_stop=None) -> Optional[StoppingCriteriaList]:
+    return StoppingCriteriaList([CancelCriteria(should_stop)]) if should_stop is not None else None
@@ -0,0 +1,245 @@
+import gc
+import importlib
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from PIL import Image
+
+# Modul engine baru di-import saat dibutuhkan, jadi torch/transformers nggak
+# ikut ke-load waktu halaman pertama dirender.
+ENGINES = {
+    "donut": ("src.model.donut", "DonutModel"),
+    "florence": ("src.model.florence", "FlorenceModel"),
+    "stub": ("src.model.stub", "StubModel"),
+    "cascade": ("src.model.cascade", "CascadeModel"),
+}
+
+# (width, height) input vision encoder per engine, sama dengan AIModel.input_size setelah load.
+# Dipakai preprocess single-warp supaya nggak perlu load weights dulu.
+ENGINE_INPUT_SIZES = {
+    "donut": (960, 1280),
+    "florence": (768, 768),
+    "stub": (768, 768),
+}
+
+DEFAULT_ENGINE = os.getenv("OCR_DEFAULT_ENGINE", "donut")
+# Batas total memori weights engine yang resident (byte), 0 = tanpa batas.
+# Kalau lewat, engine yang paling lama nggak dipakai di-offload / dibuang (LRU).
+MODEL_MEMORY_BUDGET = int(os.getenv("OCR_MODEL_MEMORY_BUDGET", 0))
+# Kalau diset, engine yang kena evict di-offload ke safetensors mmap di folder ini (reload cepat)
+MODEL_OFFLOAD_DIR = os.getenv("OCR_MODEL_OFFLOAD_DIR") or None
+
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+WARMING_UP = "warming_up"
+READY = "ready"
+OFFLOADED = "offloaded"
+FAILED = "error"
+
+def load_engine(name: str, **kwargs):
+    module_name, class_name = ENGINES[name]
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
+
+def warmup(model, size=(640, 960)):
+    """Satu forward pass dengan gambar kosong: JIT/compile, alokasi buffer, load kernel."""
+    # Engine yang punya warm-up sendiri (misal RemoteModel: cukup minta server load engine)
+    if hasattr(model, "warmup"):
+        model.warmup()
+        return
+    dummy = Image.new("RGB", size, "white")
+    model._inference(model._preprocess(dummy))
+
+class ModelRegistry:
+    """
+    Load engine secara lazy (sekali per proses) dan simpan status load-nya
+    supaya UI bisa nampilin progress. `wrap` dipakai untuk membungkus model
+    yang sudah siap (cache, hooks, ...).
+    Total memori weights dijaga di bawah `memory_budget`: engine LRU di-offload
+    ke `offload_dir` (safetensors mmap) atau dibuang dan di-load ulang saat dipakai lagi.
+    `on_evict(name)` dipanggil setelah engine dibuang, supaya pemegang referensi lain
+    (misal MicroBatcher di server) ikut melepasnya.
+    """
+    def __init__(self, wrap: Optional[Callable] = None, engine_kwargs: Optional[Dict] = None,
+                 remote: Optional[str] = None, memory_budget: int = MODEL_MEMORY_BUDGET,
+                 offload_dir: Optional[str] = MODEL_OFFLOAD_DIR, on_evict: Optional[Callable] = None):
+        self.wrap = wrap
+        self.on_evict = on_evict
+        self.memory_budget = memory_budget
+        self.offload_dir = offload_dir
+        # URL inference server (src/server.py); kalau diset, semua engine jadi RemoteModel
+        self.remote = remote
+        self.engine_kwargs = engine_kwargs or {}
+        # Tier cascade diambil dari registry ini juga, jadi model & wrapper-nya dipakai bareng
+        self.engine_kwargs.setdefault("cascade", {}).setdefault("loader", self.get)
+        self._models = {}
+        self._status = {
+            name: {"state": NOT_LOADED, "loads": 0, "reloads": 0, "evictions": 0, "offloads": 0, "memory_bytes": 0}
+            for name in ENGINES
+        }
+        self._locks = {name: threading.Lock() for name in ENGINES}
+        self._last_used = {}
+        # Semua tulis ke _models & iterasi _enforce_budget lewat lock ini
+        self._budget_lock = threading.Lock()
+
+    def get(self, name: str):
+        """Return model siap pakai; load (dan warm-up) dulu kalau belum. Blocking."""
+        model = self._models.get(name)
+        if model is not None:
+            self._touch(name)
+            return model
+
+        with self._locks[name]:
+            # Bisa jadi sudah di-load thread lain (warm-up) selama nunggu lock
+            if name in self._models:
+                self._touch(name)
+                return self._models[name]
+            return self._load(name)
+
+    def _touch(self, name: str):
+        self._last_used[name] = time.monotonic()
+        status = self._status[name]
+        with self._budget_lock:
+            reloaded = status["state"] == OFFLOADED
+            if reloaded:
+                # Weights mmap masuk RAM lagi begitu dipakai, jadi dihitung resident lagi
+                status["state"] = READY
+                status["reloads"] += 1
+        if reloaded:
+            self._enforce_budget(keep=name)
+
+    def _load(self, name: str):
+        status = self._status[name]
+        try:
+            status.update(state=LOADING, error=None)
+            start = time.perf_counter()
+            if self.remote:
+                remote = importlib.import_module("src.model.remote")
+                model = remote.RemoteModel(name, url=self.remote)
+            else:
+                model = load_engine(name, **self.engine_kwargs.get(name, {}))
+            status["load_seconds"] = time.perf_counter() - start
+
+            status["state"] = WARMING_UP
+            start = time.perf_counter()
+            warmup(model)
+            status["warmup_seconds"] = time.perf_counter() - start
+        except Exception as e:
+            status.update(state=FAILED, error=str(e))
+            raise
+
+        residency = importlib.import_module("src.model.residency")
+        status["memory_bytes"] = residency.memory_bytes(model)
+        status["loads"] += 1
+        if status["loads"] > 1:
+            status["reloads"] += 1
+
+        if self.wrap is not None:
+            model = self.wrap(model)
+        with self._budget_lock:
+            self._models[name] = model
+            status["state"] = READY
+            self._last_used[name] = time.monotonic()
+        self._enforce_budget(keep=name)
+        return model
+
+    def input_size(self, name: str):
+        """input_size engine tanpa load weights: dari model yang sudah ada, kalau belum dari ENGINE_INPUT_SIZES."""
+        model = self._models.get(name)
+        if model is not None:
+            return model.input_size
+        if name == "cascade":
+            # Cascade pakai input tier pertama
+            tiers = self.engine_kwargs["cascade"].get("tiers") or importlib.import_module("src.model.cascade").CASCADE_TIERS
+            return self.input_size(tiers[0])
+        return ENGINE_INPUT_SIZES.get(name)
+
+    def resident_bytes(self) -> int:
+        return sum(s["memory_bytes"] for s in self._status.values() if s["state"] == READY)
+
+    def _enforce_budget(self, keep: str):
+        """Evict engine LRU (selain `keep`) sampai total weights resident <= memory_budget."""
+        if not self.memory_budget:
+            return
+        dropped = []
+        with self._budget_lock:
+            while self.resident_bytes() > self.memory_budget:
+                victims = [
+                    name for name in self._models
+                    if name != keep and self._status[name]["state"] == READY and self._status[name]["memory_bytes"]
+                ]
+                if not victims:
+                    break
+                victim = min(victims, key=lambda name: self._last_used.get(name, 0))
+                if self._evict(victim):
+                    dropped.append(victim)
+        # on_evict (misal tutup MicroBatcher, join worker-nya) di luar lock: worker itu bisa lagi nunggu lock ini
+        for name in dropped:
+            self._released(name)
+
+    def evict(self, name: str):
+        """
+        Offload weights ke safetensors mmap kalau `offload_dir` diset (model tetap di registry,
+        page-nya bisa dibuang OS), kalau nggak/gagal model dilepas dan nanti di-load ulang.
+        Request yang masih jalan tetap pegang referensinya sampai selesai.
+        """
+        with self._budget_lock:
+            dropped = self._evict(name)
+        if dropped:
+            self._released(name)
+
+    def _evict(self, name: str) -> bool:
+        """Bagian evict yang ubah _models/_status (panggil sambil pegang _budget_lock). True kalau model dilepas."""
+        model = self._models.get(name)
+        if model is None:
+            return False
+        status = self._status[name]
+        residency = importlib.import_module("src.model.residency")
+        if self.offload_dir and residency.offload_to_mmap(model, residency.offload_path(self.offload_dir, name, model)):
+            status["state"] = OFFLOADED
+            status["offloads"] += 1
+            return False
+
+        del self._models[name]
+        status["state"] = NOT_LOADED
+        status["evictions"] += 1
+        return True
+
+    def _released(self, name: str):
+        if self.on_evict is not None:
+            self.on_evict(name)
+        gc.collect()
+
+    def warmup_async(self, name: str = DEFAULT_ENGINE) -> threading.Thread:
+        """Load + warm-up di background thread, error cukup dicatat di status."""
+        def target():
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Warm-up {name} gagal: {e}")
+
+        thread = threading.Thread(target=target, name=f"warmup-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def metrics(self) -> Dict[str, float]:
+        """Gauge residency per engine, untuk MetricsRegistry.add_collector."""
+        gauges = {
+            "ocr_model_memory_budget_bytes": self.memory_budget,
+            "ocr_model_resident_bytes_total": self.resident_bytes(),
+        }
+        for name, status in self._status.items():
+            label = f'{{engine="{name}"}}'
+            gauges[f"ocr_model_resident{label}"] = int(status["state"] == READY)
+            gauges[f"ocr_model_memory_bytes{label}"] = status["memory_bytes"]
+            gauges[f"ocr_model_load_seconds{label}"] = status.get("load_seconds", 0)
+            for key in ("loads", "reloads", "evictions", "offloads"):
+                gauges[f"ocr_model_{key}{label}"] = status[key]
+        return gauges
+
+    def state(self, name: str) -> str:
+        return self._status[name]["state"]
+
+    def status(self) -> Dict[str, dict]:
+        return {name: dict(status) for name, status in self._status.items()}
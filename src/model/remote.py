@@ -0,0 +1,112 @@
+import http.client
+import io
+import json
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+
+from PIL import Image
+
+from base import AIModel, ReceiptData, ScanStream, check_stop
+
+# http://host:port atau unix:///path/ke/socket (lihat src/server.py)
+SERVER_URL = os.getenv("OCR_SERVER_URL", "http://127.0.0.1:8600")
+SERVER_TIMEOUT = float(os.getenv("OCR_SERVER_TIMEOUT", 300))
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = SERVER_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+class RemoteModel(AIModel):
+    """
+    Client tipis untuk inference server: model di-load sekali di server,
+    app cuma kirim PNG hasil preprocess dan terima ReceiptData.
+    Batching lintas client dikerjakan server.
+    """
+    def __init__(self, engine: str, url: str = SERVER_URL, timeout: float = SERVER_TIMEOUT):
+        self.engine = engine
+        self.name = engine
+        self.url = urlparse(url)
+        self.timeout = timeout
+        self._settings = {}
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.url.scheme == "unix":
+            return UnixHTTPConnection(self.url.path, self.timeout)
+        return http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=self.timeout)
+
+    def _request(self, method: str, path: str, body: bytes = None) -> bytes:
+        conn = self._connection()
+        try:
+            headers = {"Content-Type": "image/png"} if body is not None else {}
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+        if response.status != 200:
+            try:
+                message = json.loads(data).get("error")
+            except ValueError:
+                message = data[:200]
+            raise RuntimeError(f"Inference server {response.status}: {message}")
+        return data
+
+    def warmup(self):
+        """Minta server load engine-nya (blocking) + ambil info input & settings."""
+        info = json.loads(self._request("GET", f"/engines/{self.engine}"))
+        self.input_size = tuple(info["input_size"]) if info.get("input_size") else None
+        self._settings = info.get("generation_settings") or {}
+
+    def generation_settings(self) -> dict:
+        return {"remote": self.engine, **self._settings}
+
+    def run(self, image: Image.Image) -> ReceiptData:
+        return self._scan(image, tiled=False)
+
+    def run_batch(self, images: List[Image.Image]) -> List[ReceiptData]:
+        if not images:
+            return []
+        # Dikirim paralel supaya MicroBatcher di server bisa gabungin jadi satu batch
+        with ThreadPoolExecutor(max_workers=len(images)) as pool:
+            return list(pool.map(self.run, images))
+
+    def run_tiled(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> ReceiptData:
+        # Request yang sudah terkirim nggak bisa dihentikan, cukup jangan kirim kalau sudah batal
+        check_stop(should_stop)
+        return self._scan(image, tiled=True)
+
+    def run_stream(self, image: Image.Image, should_stop: Optional[Callable[[], bool]] = None) -> ScanStream:
+        # Server belum streaming teks parsial, jadi hasilnya langsung jadi
+        check_stop(should_stop)
+        return ScanStream.completed(self.run(image))
+
+    def _scan(self, image: Image.Image, tiled: bool) -> ReceiptData:
+        payload = self._stage("preprocess", self._preprocess, image)
+        blob = self._stage("inference", self._inference, payload, tiled)
+        return self._postprocessing(blob, image)
+
+    def _preprocess(self, image):
+        # PNG lossless: pixel yang sampai di server sama persis (cache key server tetap cocok)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", compress_level=1)
+        return buffer.getvalue()
+
+    def _inference(self, payload: bytes, tiled: bool = False) -> bytes:
+        path = f"/scan/{self.engine}" + ("?tiled=1" if tiled else "")
+        return self._request("POST", path, payload)
+
+    # Parse + formatting sudah dikerjakan server, yang balik langsung ReceiptData.to_bytes()
+    def _postprocessing(self, blob: bytes, image) -> ReceiptData:
+        return ReceiptData.from_bytes(blob)
+
+    def _postprocessing_batch(self, blobs: List[bytes], images) -> List[ReceiptData]:
+        return [ReceiptData.from_bytes(blob) for blob in blobs]
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+
+def torch_module(model):
+    """nn.Module di dalam AIModel (lewat wrapper seperti CachedModel), None kalau nggak ada (stub, remote, cascade)."""
+    while model is not None:
+        inner = getattr(model, "model", None)
+        if hasattr(inner, "state_dict") and hasattr(inner, "parameters"):
+            return inner
+        model = inner
+    return None
+
+def memory_bytes(model) -> int:
+    """Ukuran parameter + buffer (termasuk packed weight int8) engine, tensor yang di-share dihitung sekali."""
+    module = torch_module(model)
+    if module is None:
+        return 0
+
+    seen = set()
+    total = 0
+
+    def add(value):
+        nonlocal total
+        if isinstance(value, (tuple, list)):
+            for item in value:
+                add(item)
+        elif hasattr(value, "untyped_storage"):
+            storage = value.untyped_storage()
+            if storage.data_ptr() not in seen:
+                seen.add(storage.data_ptr())
+                total += storage.nbytes()
+
+    for value in module.state_dict().values():
+        add(value)
+    return total
+
+def offload_path(directory: str, name: str, model) -> str:
+    """File per engine + settings (profile, dtype, ...), jadi profile beda nggak ketuker."""
+    settings = json.dumps(model.generation_settings(), sort_keys=True, default=str)
+    digest = hashlib.sha1(settings.encode()).hexdigest()[:12]
+    return os.path.join(directory, f"{name}-{digest}.safetensors")
+
+def offload_to_mmap(model, path: str) -> bool:
+    """
+    Simpan weights ke safetensors (sekali), lalu ganti tensor module dengan versi mmap dari file itu.
+    Page-nya file-backed, jadi OS bisa buang dari RAM kalau perlu dan dibaca lagi waktu dipakai.
+    Return False kalau nggak bisa (misal profile int8: packed weight bukan tensor biasa).
+    """
+    module = torch_module(model)
+    if module is None:
+        return False
+    try:
+        from safetensors import safe_open
+        from safetensors.torch import save_model
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            save_model(module, tmp_path)
+            os.replace(tmp_path, path)
+        # strict=False: save_model membuang duplikat tensor yang di-tie, di-tie ulang di bawah
+        # get_tensor dari safe_open nunjuk langsung ke mmap file (bukan copy), jadi RAM anonim-nya lepas
+        with safe_open(path, framework="pt") as f:
+            state = {key: f.get_tensor(key) for key in f.keys()}
+        module.load_state_dict(state, strict=False, assign=True)
+        if hasattr(module, "tie_weights"):
+            module.tie_weights()
+        return True
+    except Exception as e:
+        print(f"Offload {path} gagal: {e}")
+        return False
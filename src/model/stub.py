@@ -0,0 +1,49 @@
+import numpy as np
+
+from base import AIModel
+
+# Teks OCR palsu yang rapi, jadi lolos fast-path parser lokal (tanpa network)
+STUB_TEXT = """WARUNG STUB
+2 NASI GORENG 50.000
+ES TEH MANIS x2 10.000
+KERUPUK 3 2.000 6.000
+TOTAL Rp 66.000"""
+
+class StubModel(AIModel):
+    """
+    Engine palsu tanpa weights untuk benchmark/test offline.
+    Tetap lewat _preprocess -> _inference -> _postprocessing seperti engine asli.
+    """
+    name = "stub"
+    batched = True
+
+    def __init__(self, text: str = STUB_TEXT, input_size=(768, 768), profile=None):
+        # profile diterima supaya bisa dipakai di harness yang sama dengan engine asli
+        self.profile = profile
+        self.text = text
+        self.input_size = input_size
+
+    def generation_settings(self) -> dict:
+        return {"model": "stub", "text": self.text}
+
+    def _preprocess(self, image):
+        # Kira-kira kerjaan image processor asli: resize + normalize + stack
+        images = image if isinstance(image, list) else [image]
+        return np.stack([
+            np.asarray(im.convert("RGB").resize(self.input_size), dtype=np.float32) / 255.0
+            for im in images
+        ])
+
+    def _inference(self, pixel_values):
+        return [self.text] * len(pixel_values)
+
+    def _stage_info(self, stage, result) -> dict:
+        if stage != "inference":
+            return {}
+        return {"tokens": sum(len(text.split()) for text in result)}
+
+    def _postprocessing(self, output, image):
+        return output[0]
+
+    def _postprocessing_batch(self, output, images):
+        return list(output)
@@ -0,0 +1,206 @@
+"""
+Inference server: satu proses yang pegang model, dipakai bareng oleh banyak replika app.
+
+    python src/server.py --port 8600                  # http://127.0.0.1:8600
+    python src/server.py --unix /tmp/ocr.sock         # Unix socket
+    OCR_SERVER_URL=http://127.0.0.1:8600 streamlit run src/app.py
+
+API:
+    GET  /engines            status load semua engine
+    GET  /engines/<name>     load engine (blocking), return input_size + generation_settings
+    POST /scan/<name>        body PNG hasil preprocess, ?tiled=1 untuk nota panjang;
+                             return ReceiptData.to_bytes()
+    GET  /metrics            Prometheus text
+
+Request run() dari banyak client dikumpulin per engine oleh MicroBatcher.
+"""
+import argparse
+import io
+import json
+import os
+import socketserver
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- PATH SETUP ---
+current_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(current_dir)
+
+if root_dir not in sys.path:
+    sys.path.append(root_dir)
+
+model_dir = os.path.join(current_dir, "model")
+if model_dir not in sys.path:
+    sys.path.append(model_dir)
+
+from PIL import Image
+
+from src.model.batching import BatcherClosed, MicroBatcher
+from src.model.cached import CachedModel
+from src.model.hooks import MetricsHook
+from src.model.registry import DEFAULT_ENGINE, ENGINES, ModelRegistry
+from src.utility.cache import DiskCache
+from src.utility.metrics import REGISTRY
+
+class InferenceService:
+    """Registry engine + satu MicroBatcher per engine."""
+    def __init__(self, max_batch_size: int = 4, max_wait_ms: float = 50, cache: bool = True, profile=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.result_cache = DiskCache() if cache else None
+        engine_kwargs = {name: {"profile": profile} for name in ENGINES} if profile else None
+        self.registry = ModelRegistry(wrap=self._instrument, engine_kwargs=engine_kwargs, on_evict=self._drop_batcher)
+        REGISTRY.add_collector(self.registry.metrics)
+        self._batchers = {}
+        self._lock = threading.Lock()
+
+    def _instrument(self, model):
+        if self.result_cache is not None:
+            model = CachedModel(model, self.result_cache)
+        model.add_hook(MetricsHook())
+        return model
+
+    def batcher(self, name: str) -> MicroBatcher:
+        model = self.registry.get(name)
+        with self._lock:
+            batcher = self._batchers.get(name)
+            # Engine yang di-evict & di-load ulang registry dapat batcher baru, yang lama dilepas
+            if batcher is None or batcher.model is not model:
+                if batcher is not None:
+                    batcher.close()
+                batcher = self._batchers[name] = MicroBatcher(model, self.max_batch_size, self.max_wait_ms)
+            return batcher
+
+    def _drop_batcher(self, name: str):
+        """Dipanggil registry saat engine di-evict: batcher-nya ikut ditutup supaya weights bisa dilepas."""
+        with self._lock:
+            batcher = self._batchers.pop(name, None)
+        if batcher is not None:
+            batcher.close()
+
+    def describe(self, name: str) -> dict:
+        model = self.registry.get(name)
+        return {
+            "name": name,
+            "input_size": model.input_size,
+            "generation_settings": model.generation_settings(),
+        }
+
+    def scan(self, name: str, image: Image.Image, tiled: bool = False):
+        if tiled:
+            # Strip satu nota sudah di-batch di dalam run_tiled
+            return self.registry.get(name).run_tiled(image)
+        # Batcher bisa ditutup di tengah request kalau engine-nya di-evict; ulang sekali pakai batcher baru
+        try:
+            return self.batcher(name).run(image)
+        except BatcherClosed:
+            return self.batcher(name).run(image)
+
+    def close(self):
+        with self._lock:
+            batchers = list(self._batchers.values())
+        for batcher in batchers:
+            batcher.close()
+
+def make_handler(service: InferenceService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parts = urlparse(self.path).path.strip("/").split("/")
+            if parts == ["engines"]:
+                return self._send_json(200, service.registry.status())
+            if len(parts) == 2 and parts[0] == "engines":
+                return self._with_engine(parts[1], lambda: self._send_json(200, service.describe(parts[1])))
+            if parts == ["metrics"]:
+                return self._send(200, REGISTRY.render_prometheus().encode(), "text/plain; version=0.0.4")
+            self._send_json(404, {"error": f"Path tidak dikenal: {self.path}"})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "scan":
+                return self._send_json(404, {"error": f"Path tidak dikenal: {self.path}"})
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                image = Image.open(io.BytesIO(body))
+                image.load()
+            except Exception as e:
+                return self._send_json(400, {"error": f"Gambar tidak valid: {e}"})
+
+            tiled = parse_qs(url.query).get("tiled", ["0"])[0] == "1"
+            self._with_engine(
+                parts[1],
+                lambda: self._send(200, service.scan(parts[1], image, tiled).to_bytes(), "application/json"),
+            )
+
+        def _with_engine(self, name, fn):
+            if name not in ENGINES:
+                return self._send_json(404, {"error": f"Engine tidak dikenal: {name}"})
+            try:
+                fn()
+            except Exception as e:
+                self._send_json(500, {"error": f"Model Crash: {e}"})
+
+        def _send_json(self, status, data):
+            self._send(status, json.dumps(data, default=str).encode(), "application/json")
+
+        def _send(self, status, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            # Client Unix socket nggak punya (host, port)
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(service: InferenceService, host: str = "127.0.0.1", port: int = 8600, unix_path: str = None):
+    handler = make_handler(service)
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.remove(unix_path)
+        return UnixHTTPServer(unix_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inference server OCR nota (dipakai bareng banyak app).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--unix", help="Path Unix socket (menggantikan host/port)")
+    parser.add_argument("--batch-size", type=int, default=4, help="Maksimal gambar per run_batch")
+    parser.add_argument("--max-wait-ms", type=float, default=50, help="Maksimal nunggu batch penuh")
+    parser.add_argument("--profile", help="Profile inference (fp32, bf16, int8, int8-compiled, ...)")
+    parser.add_argument("--no-cache", action="store_true", help="Matikan DiskCache hasil scan")
+    parser.add_argument("--warmup", default=DEFAULT_ENGINE, help="Engine yang di-load di awal (kosongkan untuk skip)")
+    args = parser.parse_args(argv)
+
+    service = InferenceService(args.batch_size, args.max_wait_ms, cache=not args.no_cache, profile=args.profile)
+    if args.warmup:
+        service.registry.warmup_async(args.warmup)
+
+    server = make_server(service, args.host, args.port, args.unix)
+    where = args.unix or f"http://{args.host}:{args.port}"
+    print(f"Inference server jalan di {where}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+if __name__ == "__main__":
+    main()
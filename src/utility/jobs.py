@@ -0,0 +1,163 @@
+import itertools
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED = (DONE, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    def __init__(self, job_id: str, key: str):
+        self.id = job_id
+        self.key = key
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        # Teks parsial (misal OCR streaming) yang bisa ditampilkan sambil nunggu
+        self.progress = ""
+        self.subscribers = 1
+        self.cancel_requested = False
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    def check_cancelled(self):
+        """Dipanggil fungsi job di titik aman untuk berhenti lebih awal."""
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "key": self.key,
+            "status": self.status,
+            "error": self.error,
+            "subscribers": self.subscribers,
+            "queued_seconds": (self.started or time.time()) - self.created,
+            "running_seconds": ((self.finished or time.time()) - self.started) if self.started else 0.0,
+        }
+
+class JobExecutor:
+    """
+    Executor job per proses (dipakai bareng semua sesi Streamlit).
+    Job dengan `key` yang sama yang masih jalan digabung jadi satu komputasi;
+    hasil job yang sudah selesai disimpan `result_ttl` detik untuk polling.
+    """
+    def __init__(self, max_workers: int = 2, result_ttl: float = 600):
+        self.result_ttl = result_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scan-job")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._in_flight: Dict[str, Job] = {}
+        self._ids = itertools.count(1)
+        self.coalesced = 0
+
+    def submit(self, key: str, fn: Callable, *args) -> str:
+        """Jalankan fn(job, *args) di background, return job id. Key yang sama & masih jalan -> id yang sama."""
+        with self._lock:
+            self._prune()
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.subscribers += 1
+                self.coalesced += 1
+                return job.id
+
+            job = Job(f"job-{next(self._ids)}", key)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+            job.future = self._pool.submit(self._run, job, fn, args)
+            return job.id
+
+    def _run(self, job: Job, fn: Callable, args):
+        with self._lock:
+            if job.cancel_requested:
+                self._finish(job, CANCELLED)
+                return
+            job.status = RUNNING
+            job.started = time.time()
+        try:
+            result = fn(job, *args)
+        except (JobCancelled, CancelledError):
+            with self._lock:
+                self._finish(job, CANCELLED)
+        except Exception as e:
+            with self._lock:
+                job.error = str(e)
+                self._finish(job, FAILED)
+        else:
+            with self._lock:
+                job.result = result
+                self._finish(job, DONE)
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished = time.time()
+        if self._in_flight.get(job.key) is job:
+            del self._in_flight[job.key]
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in FINISHED and now - job.finished > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        job = self.get(job_id)
+        return job.to_dict() if job else None
+
+    def result(self, job_id: str, timeout: Optional[float] = None):
+        """Blocking sampai job selesai (untuk pemakaian non-UI)."""
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        job.future.result(timeout=timeout)
+        if job.status == FAILED:
+            raise RuntimeError(job.error)
+        if job.status == CANCELLED:
+            raise JobCancelled()
+        return job.result
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Satu subscriber batal. Komputasi baru benar-benar dihentikan kalau
+        semua sesi yang nunggu job ini sudah batal.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            job.subscribers -= 1
+            if job.subscribers > 0:
+                return True
+            job.cancel_requested = True
+            if job.future.cancel():
+                self._finish(job, CANCELLED)
+            elif self._in_flight.get(job.key) is job:
+                # Lagi jalan: submit baru dengan key sama jangan nempel ke job yang mau berhenti
+                del self._in_flight[job.key]
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {**counts, "coalesced": self.coalesced}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
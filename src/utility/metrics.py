@@ -0,0 +1,127 @@
+import bisect
+import os
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Tuple
+
+# Bucket latency (detik), dari preprocessing cepat sampai decode CPU puluhan detik
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _label_key(labels: dict) -> Tuple:
+    return tuple(sorted((labels or {}).items()))
+
+def _format_labels(key: Tuple, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class MetricsRegistry:
+    """Counter + histogram sederhana, bisa dirender ke format teks Prometheus."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, labels: dict = None):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += value
+
+    def observe(self, name: str, value: float, labels: dict = None, buckets=DEFAULT_BUCKETS):
+        key = (name, _label_key(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            index = bisect.bisect_left(hist["buckets"], value)
+            if index < len(hist["buckets"]):
+                hist["counts"][index] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]):
+        """Collector dipanggil saat render, return {nama_gauge(+label): nilai} (misal statistik cache)."""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = {f"{name}{_format_labels(key)}": value for (name, key), value in self._counters.items()}
+            histograms = {
+                f"{name}{_format_labels(key)}": {"count": h["count"], "sum": h["sum"], "mean": h["sum"] / h["count"]}
+                for (name, key), h in self._histograms.items() if h["count"]
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name in seen:
+                return
+            seen.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                header(name, "counter")
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+            for (name, key), h in sorted(self._histograms.items()):
+                header(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(h["buckets"], h["counts"]):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{_format_labels(key, le)} {h['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {h['sum']}")
+                lines.append(f"{name}_count{_format_labels(key)} {h['count']}")
+
+        for collector in self._collectors:
+            for name, value in sorted(collector().items()):
+                # Nama gauge boleh sudah berlabel, misal 'x{engine="donut"}'
+                header(name.split("{", 1)[0], "gauge")
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Tulis ke file (untuk node_exporter textfile collector)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render_prometheus())
+        # rename atomic, scraper nggak pernah baca file setengah jadi
+        os.replace(tmp_path, path)
+
+    def serve_prometheus(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """Endpoint /metrics di thread background."""
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        return server
+
+# Registry global per proses
+REGISTRY = MetricsRegistry()
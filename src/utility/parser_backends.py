@@ -0,0 +1,137 @@
+import copy
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from .parsing import (
+    HF_TOKEN,
+    LLM_MODEL,
+    _parse_receipt_llm,
+    build_messages,
+    cached_llm_parse,
+    parse_receipt_local,
+)
+
+# "router" (HF Router API), "local" (instruct model kecil in-process di CPU), "rules" (parser rule-based), "stub"
+PARSER_BACKEND = os.getenv("PARSER_BACKEND", "router")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+LOCAL_LLM_MAX_NEW_TOKENS = int(os.getenv("LOCAL_LLM_MAX_NEW_TOKENS", 512))
+
+EMPTY_RESULT = {"items": [], "total": 0}
+
+class ParserBackend(ABC):
+    """OCR text (string / dict CORD) -> {"items": [{"name", "qty", "price"}], "subtotal", "total"}."""
+    name = "base"
+    model_name = None
+
+    @abstractmethod
+    def parse(self, ocr_text) -> dict:
+        pass
+
+    def available(self) -> bool:
+        """False kalau backend pasti gagal (misal token belum diset)."""
+        return True
+
+    def describe(self) -> str:
+        """Identitas backend untuk cache key / generation_settings engine."""
+        return f"{self.name}:{self.model_name}" if self.model_name else self.name
+
+class RouterBackend(ParserBackend):
+    """Qwen 7B lewat HF Router API (perilaku lama)."""
+    name = "router"
+    model_name = LLM_MODEL
+
+    def __init__(self, use_cache: bool = True):
+        self.use_cache = use_cache
+
+    def available(self) -> bool:
+        return bool(HF_TOKEN)
+
+    def parse(self, ocr_text) -> dict:
+        return _parse_receipt_llm(ocr_text, use_cache=self.use_cache)
+
+class LocalLLMBackend(ParserBackend):
+    """
+    Instruct model kecil (default Qwen2.5-0.5B) via transformers di CPU, tanpa network
+    setelah weights ada di cache HF. Prompt, kompaksi & cache respons sama dengan router.
+    """
+    name = "local"
+
+    def __init__(self, model_name: str = LOCAL_LLM_MODEL, max_new_tokens: int = LOCAL_LLM_MAX_NEW_TOKENS,
+                 use_cache: bool = True):
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens
+        self.use_cache = use_cache
+        self.tokenizer = None
+        self.model = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Import di sini supaya backend lain nggak perlu torch/transformers
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        with self._lock:
+            if self.model is None:
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model = AutoModelForCausalLM.from_pretrained(self.model_name).eval()
+
+    def _generate(self, prompt_text: str):
+        import torch
+
+        self._load()
+        inputs = self.tokenizer.apply_chat_template(
+            build_messages(prompt_text), add_generation_prompt=True, return_tensors="pt", return_dict=True
+        )
+        with torch.inference_mode():
+            output = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=False)
+        generated = output[0, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.decode(generated, skip_special_tokens=True), int(output.shape[1])
+
+    def parse(self, ocr_text) -> dict:
+        return cached_llm_parse(ocr_text, self.model_name, self._generate, self.use_cache)
+
+class RuleBasedBackend(ParserBackend):
+    """parse_receipt_local tanpa syarat confidence: offline, paling cepat, akurat di layout rapi."""
+    name = "rules"
+
+    def parse(self, ocr_text) -> dict:
+        result = parse_receipt_local(ocr_text)
+        return {"items": result["items"], "subtotal": result["subtotal"], "total": result["total"]}
+
+class StubBackend(ParserBackend):
+    """Selalu return `result` yang sama. Untuk test/benchmark offline (batas bawah latency)."""
+    name = "stub"
+
+    def __init__(self, result: Optional[dict] = None):
+        self.result = result or EMPTY_RESULT
+
+    def parse(self, ocr_text) -> dict:
+        return copy.deepcopy(self.result)
+
+PARSER_BACKENDS = {
+    "router": RouterBackend,
+    "local": LocalLLMBackend,
+    "rules": RuleBasedBackend,
+    "stub": StubBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def load_parser_backend(name: str, **kwargs) -> ParserBackend:
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Parser backend tidak dikenal: {name}")
+    return PARSER_BACKENDS[name](**kwargs)
+
+def get_parser_backend() -> ParserBackend:
+    """Backend dari PARSER_BACKEND (sekali per proses). Kalau nggak bisa dipakai, turun ke rules."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend = load_parser_backend(PARSER_BACKEND)
+            if not backend.available():
+                print(f"Parser backend '{backend.name}' tidak bisa dipakai (HF_TOKEN belum diset?), pakai 'rules'.")
+                backend = RuleBasedBackend()
+            _backend = backend
+        return _backend
@@ -1,37 +1,121 @@
 import os
+import re
 import json
+import asyncio
+import difflib
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+from .cache import DEFAULT_CACHE_DIR, DiskCache
+
 load_dotenv()
 
 # Pastikan token ada di .env atau environment variable system
 HF_TOKEN = os.getenv("HF_TOKEN")
-API_URL = "https://router.huggingface.co/v1/chat/completions"
+API_URL = os.getenv("HF_API_URL", "https://router.huggingface.co/v1/chat/completions")
+LLM_MODEL = "Qwen/Qwen2.5-7B-Instruct"
 
-def parse_receipt(ocr_text: str):
+# (connect, read) dalam detik. Tanpa timeout worker Streamlit bisa nge-hang selamanya.
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 60))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+
+# Fast-path lokal: kalau confidence >= ini dan item reconcile dengan total, LLM di-skip
+FAST_PATH_MIN_CONFIDENCE = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", 0.8))
+RECONCILE_TOLERANCE = 0.01
+# Kalau subtotal nggak kebaca, total boleh lebih besar dari jumlah item sampai segini (PPN/PB1 + service)
+RECONCILE_MAX_SURCHARGE = float(os.getenv("RECONCILE_MAX_SURCHARGE", 0.25))
+
+# Naikkan kalau isi prompt _build_payload berubah, supaya cache respons LLM lama nggak kepakai
+PROMPT_VERSION = 4
+# Cache respons LLM di disk, key = teks OCR (sudah dikompak & dinormalisasi) + model + versi prompt
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(DEFAULT_CACHE_DIR, "llm.sqlite"))
+# Harga minimal (IDR) supaya satu baris dianggap relevan waktu kompaksi prompt
+COMPACT_MIN_PRICE = 100
+
+_PRICE_RE = re.compile(r"^(?:rp)?(\d{1,3}(?:[.,]\d{3})+|\d+)(?:[.,]\d{2})?(?:,-)?$", re.IGNORECASE)
+_QTY_RE = re.compile(r"^(?:x(\d{1,3})|(\d{1,3})x?)$", re.IGNORECASE)
+_TOTAL_RE = re.compile(r"^(grand\s*total|total(\s*(bayar|harga|belanja))?)\b", re.IGNORECASE)
+_SUBTOTAL_RE = re.compile(r"^sub[\s-]*total\b", re.IGNORECASE)
+_SKIP_RE = re.compile(
+    r"^(tax|ppn|pajak|pb1|service|svc|srv|cash|tunai|change|kembali|kembalian|disc|diskon|discount|"
+    r"debit|credit|kredit|card|kartu|bayar|payment|rounding|pembulatan|total\s*(item|qty))\b",
+    re.IGNORECASE,
+)
+# Baris yang pasti bukan nama item: alamat, NPWP, telepon, tanggal/jam, ucapan penutup
+_NOISE_RE = re.compile(
+    r"^(jl\.?|jalan|alamat|npwp|telp|tel\.?|phone|hp|kasir|cashier|no\.?\s*(struk|nota|trx)|"
+    r"terima\s*kasih|thank\s*you|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{1,2}:\d{2})",
+    re.IGNORECASE,
+)
+_DATETIME_RE = re.compile(r"\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{1,2}:\d{2}(:\d{2})?")
+
+_stats_lock = threading.Lock()
+_parse_stats = {
+    "fast_path": 0,
+    "llm": 0,
+    "llm_request": 0,
+    "llm_cache_hit": 0,
+    "compaction_tokens_saved": 0,
+    "cache_tokens_saved": 0,
+}
+
+_session = None
+_session_lock = threading.Lock()
+_executor = None
+_llm_cache = None
+
+class _PostRetry(Retry):
     """
-    Kirim raw OCR text ke Qwen via HF Router API buat dapet JSON bersih.
+    Retry untuk POST chat-completions. Connection reset / server tutup koneksi keep-alive basi
+    (ProtocolError) tetap di-retry, read timeout nggak: request-nya mungkin sudah diproses
+    (ditagih) server, dan satu parse jadi maksimal ~READ_TIMEOUT, bukan (MAX_RETRIES+1)x.
     """
-    if not HF_TOKEN:
-        print("ERROR: HF_TOKEN belum diset.")
-        return {"items": [], "total": 0}
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if isinstance(error, ReadTimeoutError):
+            raise error
+        return super().increment(method, url, response, error, _pool, _stacktrace)
 
-    headers = {
-        "Authorization": f"Bearer {HF_TOKEN}",
-        "Content-Type": "application/json"
-    }
+def get_session() -> requests.Session:
+    """Session bersama (keep-alive + retry 429/5xx, gagal connect & koneksi putus), dibuat sekali per proses."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = _PostRetry(
+                total=MAX_RETRIES,
+                backoff_factor=RETRY_BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["POST"]),
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONCURRENCY, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
 
-    payload = {
-        "model": "Qwen/Qwen2.5-7B-Instruct",
-        "messages": [
-            {
-                "role": "system",
-                "content": "You extract structured JSON from messy receipt OCR. Return JSON only."
-            },
-            {
-                "role": "user",
-                "content": f"""
+def build_messages(ocr_text: str) -> list:
+    """Prompt chat (system + user) yang sama untuk semua backend LLM."""
+    return [
+        {
+            "role": "system",
+            "content": "You extract structured JSON from messy receipt OCR. Return JSON only."
+        },
+        {
+            "role": "user",
+            "content": f"""
 Parse this receipt into JSON.
 
 Schema:
@@ -44,6 +128,7 @@ Schema:
       "price": number
     }}
   ],
+  "subtotal": number | null,
   "total": number,
   "payment_method": string | null
 }}
@@ -57,26 +142,430 @@ Rules:
 OCR TEXT:
 {ocr_text}
 """
-            }
-        ],
+        }
+    ]
+
+def _build_payload(ocr_text: str) -> dict:
+    return {
+        "model": LLM_MODEL,
+        "messages": build_messages(ocr_text),
         "temperature": 0.1,
         "max_tokens": 512
     }
 
-    try:
-        r = requests.post(API_URL, headers=headers, json=payload)
-        r.raise_for_status()
+def get_llm_cache():
+    """DiskCache respons LLM (sekali per proses), None kalau dimatikan lewat LLM_CACHE=0."""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _session_lock:
+        if _llm_cache is None:
+            _llm_cache = DiskCache(LLM_CACHE_PATH)
+        return _llm_cache
+
+def estimate_tokens(text: str) -> int:
+    """Perkiraan kasar jumlah token (~4 karakter per token), cukup buat laporan hemat token."""
+    return (len(text) + 3) // 4
+
+# Field CORD (output Donut) yang dipakai parse; sisanya (cashprice, changeprice, menuqty_cnt, ...) dibuang
+CORD_KEEP = {
+    "menu": ("nm", "cnt", "unitprice", "price"),
+    "sub_total": ("subtotal_price", "tax_price", "service_price", "discount_price"),
+    "total": ("total_price",),
+}
+
+def _compact_cord(data: dict) -> dict:
+    compact = {}
+    for key, fields in CORD_KEEP.items():
+        value = data.get(key)
+        entries = value if isinstance(value, list) else [value]
+        kept = [
+            {field: entry[field] for field in fields if entry.get(field) not in (None, "")}
+            for entry in entries if isinstance(entry, dict)
+        ]
+        kept = [entry for entry in kept if entry]
+        if kept:
+            compact[key] = kept if isinstance(value, list) else kept[0]
+    return compact
+
+def split_price_lines(text: str) -> List[str]:
+    """
+    OCR satu baris panjang (Florence <OCR>) -> baris semu, dipotong setelah tiap harga
+    (harga berurutan seperti '3.000 6.000' tetap satu baris) dan sebelum noise (alamat, telp, jam, ...).
+    """
+    lines, current = [], []
+    tokens = text.split()
+    for index, token in enumerate(tokens):
+        if current and _NOISE_RE.match(" ".join(tokens[index:index + 3])):
+            lines.append(" ".join(current))
+            current = []
+        current.append(token)
+        if _DATETIME_RE.fullmatch(token):
+            # Tanggal / jam berdiri sendiri, jangan nempel ke nama item sesudahnya
+            lines.append(" ".join(current))
+            current = []
+            continue
+        is_price = (parse_price(token) or 0) >= COMPACT_MIN_PRICE
+        next_is_price = index + 1 < len(tokens) and (parse_price(tokens[index + 1]) or 0) >= COMPACT_MIN_PRICE
+        if is_price and not next_is_price:
+            lines.append(" ".join(current))
+            current = []
+    if current:
+        lines.append(" ".join(current))
+    return lines
+
+def compact_ocr_text(ocr_text) -> str:
+    """
+    Buang baris noise (alamat, NPWP, jam, ucapan terima kasih, ...) sebelum dikirim ke LLM:
+    yang disimpan baris pertama (nama merchant), baris yang ada harga/qty, baris total, dan
+    baris tepat sebelum baris harga/qty (nama item di nota minimarket sering terpisah dari
+    baris '2 x 3.000 6.000'). Kalau hasilnya nggak ada harga sama sekali, teks asli dipakai utuh.
+    Dict CORD (Donut) cuma disisakan field menu/sub_total/total; teks satu baris (Florence)
+    dipotong jadi baris semu per harga dulu.
+    """
+    if isinstance(ocr_text, dict):
+        return json.dumps(_compact_cord(ocr_text) or ocr_text, ensure_ascii=False, sort_keys=True)
+
+    lines = [line.strip() for line in str(ocr_text).splitlines() if line.strip()]
+    if len(lines) == 1:
+        lines = split_price_lines(lines[0])
+    keep = [False] * len(lines)
+    priced = False
+    for index, line in enumerate(lines):
+        normalized = re.sub(r"\brp\.?\s*", "Rp", line, flags=re.IGNORECASE)
+        tokens = normalized.split()
+        has_price = any((parse_price(token) or 0) >= COMPACT_MIN_PRICE for token in tokens)
+        has_qty = bool(tokens) and bool(_QTY_RE.match(tokens[0]))
+        priced = priced or has_price
+        if index == 0 or has_price or has_qty or _TOTAL_RE.match(normalized) or _SUBTOTAL_RE.match(normalized):
+            keep[index] = True
+            if (has_price or has_qty) and index > 0 and not _NOISE_RE.match(lines[index - 1]):
+                keep[index - 1] = True
+    if not priced:
+        return str(ocr_text)
+    return "\n".join(line for line, kept in zip(lines, keep) if kept)
+
+def llm_cache_key(prompt_text: str, model_name: str = LLM_MODEL) -> str:
+    normalized = "\n".join(_normalize_line(line) for line in prompt_text.splitlines())
+    return hashlib.sha256(f"{model_name}|{PROMPT_VERSION}|{normalized}".encode()).hexdigest()
+
+def _extract_json(text: str) -> dict:
+    start = text.find("{")
+    end = text.rfind("}") + 1
+    if start == -1 or end == 0:
+        return {"items": [], "total": 0}
+    return json.loads(text[start:end])
+
+def parse_price(token: str):
+    """'Rp25.000', '25,000', '25.000,00' -> 25000. Bukan harga -> None."""
+    token = token.strip()
+    match = _PRICE_RE.match(token)
+    if not match:
+        return None
+    digits = re.sub(r"[.,]", "", match.group(1))
+    if len(digits) > 9 or (digits.startswith("0") and len(digits) > 1):
+        return None
+    value = int(digits)
+    # Angka polos kecil (tanpa Rp / separator) lebih mungkin qty daripada harga
+    if value < 100 and not token.lower().startswith("rp"):
+        return None
+    return value
+
+def _parse_qty(token: str):
+    match = _QTY_RE.match(token)
+    if not match:
+        return None
+    return int(match.group(1) or match.group(2))
+
+def _parse_item_line(tokens, pending_name=None):
+    """
+    Satu baris item -> {"name", "qty", "price"}, None kalau bukan item.
+    Baris tanpa nama ('2 x 3.500 7.000', layout minimarket) pakai `pending_name`
+    (baris nama tepat di atasnya); kalau nggak ada, bukan item.
+    """
+    prices = []
+    while tokens and len(prices) < 2:
+        price = parse_price(tokens[-1])
+        if price is None:
+            break
+        prices.insert(0, price)
+        tokens = tokens[:-1]
+    if not prices:
+        return None
+
+    qty = None
+    if tokens and _parse_qty(tokens[0]) is not None:
+        qty = _parse_qty(tokens[0])
+        tokens = tokens[1:]
+        # '2 x 3.500' / '2 @ 3.500': pemisah qty dan harga satuan, bukan nama
+        if tokens and tokens[0].lower() in ("x", "@"):
+            tokens = tokens[1:]
+    elif tokens and _parse_qty(tokens[-1]) is not None:
+        qty = _parse_qty(tokens[-1])
+        tokens = tokens[:-1]
+
+    name = " ".join(tokens).strip(" .:-")
+    if not re.search(r"[A-Za-z]", name):
+        if not pending_name:
+            return None
+        name = pending_name
+
+    price = prices[-1]
+    if len(prices) == 2:
+        unit = prices[0]
+        if qty is None and unit and price % unit == 0:
+            qty = price // unit
+        elif qty is not None and qty * unit != price:
+            return None
+    return {"name": name, "qty": qty, "price": price}
+
+def cord_to_text(data: dict) -> str:
+    """Output Donut (format CORD) -> baris 'QTY NAMA HARGA' supaya bisa lewat parser lokal."""
+    menu = data.get("menu", [])
+    if isinstance(menu, dict):
+        menu = [menu]
+    lines = []
+    for entry in menu:
+        if isinstance(entry, dict):
+            lines.append(f"{entry.get('cnt', '')} {entry.get('nm', '')} {entry.get('price', '')}")
+    subtotal = data.get("sub_total")
+    if isinstance(subtotal, dict) and subtotal.get("subtotal_price"):
+        lines.append(f"SUBTOTAL {subtotal['subtotal_price']}")
+    total = data.get("total")
+    if isinstance(total, dict) and total.get("total_price"):
+        lines.append(f"TOTAL {total['total_price']}")
+    return "\n".join(lines)
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip().lower()
+
+def _overlap_length(prev, nxt, max_overlap: int, min_ratio: float) -> int:
+    """Panjang k terbesar: k elemen terakhir `prev` ~= k elemen pertama `nxt` (per elemen)."""
+    for k in range(min(len(prev), len(nxt), max_overlap), 0, -1):
+        if all(
+            a == b or difflib.SequenceMatcher(None, a, b).ratio() >= min_ratio
+            for a, b in zip(prev[-k:], nxt[:k])
+        ):
+            return k
+    return 0
+
+def stitch_texts(texts: List[str], max_overlap_lines: int = 12, min_ratio: float = 0.8) -> str:
+    """
+    Gabung teks OCR dari strip yang overlap. Baris di awal strip berikutnya
+    yang sama (fuzzy) dengan akhir strip sebelumnya dibuang. Kalau OCR kedua
+    strip sama-sama satu baris panjang, overlap dicari per kata.
+    """
+    result_lines = []
+    for text in texts:
+        lines = [line for line in str(text).splitlines() if line.strip()]
+        if not lines:
+            continue
+        if not result_lines:
+            result_lines = lines
+            continue
+
+        prev_norm = [_normalize_line(line) for line in result_lines]
+        next_norm = [_normalize_line(line) for line in lines]
+        k = _overlap_length(prev_norm, next_norm, max_overlap_lines, min_ratio)
+        if k:
+            result_lines.extend(lines[k:])
+        elif len(lines) == 1 and len(result_lines) == 1:
+            # Dua-duanya teks tanpa newline: cari overlap per kata
+            prev_words = result_lines[-1].split()
+            next_words = " ".join(lines).split()
+            k = _overlap_length([w.lower() for w in prev_words], [w.lower() for w in next_words], max_overlap_lines * 8, 1.0)
+            # Minimal 3 kata, biar nggak kebuang cuma karena kata umum
+            if k < 3:
+                k = 0
+            result_lines[-1] = " ".join(prev_words + next_words[k:])
+        else:
+            result_lines.extend(lines)
+    return "\n".join(result_lines)
+
+def reconciles(items, total, tolerance: float = RECONCILE_TOLERANCE) -> bool:
+    """Jumlah harga item sama dengan total (toleransi relatif `tolerance`)."""
+    if not items or not total:
+        return False
+    item_sum = sum(float(item.get("price") or 0) for item in items)
+    return abs(item_sum - float(total)) <= float(total) * tolerance
+
+def reconciles_receipt(items, total, subtotal=None, tolerance: float = RECONCILE_TOLERANCE,
+                       max_surcharge: float = RECONCILE_MAX_SURCHARGE) -> bool:
+    """
+    Versi `reconciles` yang paham pajak/service: cocokkan dengan `subtotal` kalau ada,
+    kalau nggak, total boleh di atas jumlah item sampai `max_surcharge` (relatif).
+    """
+    if subtotal:
+        return reconciles(items, subtotal, tolerance)
+    if not items or not total:
+        return False
+    item_sum = sum(float(item.get("price") or 0) for item in items)
+    total = float(total)
+    return item_sum - total * tolerance <= total <= item_sum * (1 + max_surcharge) + total * tolerance
+
+def parse_receipt_local(ocr_text) -> dict:
+    """
+    Parser rule-based untuk layout nota Indonesia yang rapi
+    ('2 NASI GORENG 50.000', 'Es Teh x2 Rp 10.000', 'SUBTOTAL', 'TOTAL').
+    Hasil sama dengan parse_receipt (termasuk `subtotal`) ditambah `confidence` (0..1).
+    """
+    if isinstance(ocr_text, dict):
+        ocr_text = cord_to_text(ocr_text)
+
+    items = []
+    total = subtotal = None
+    unparsed = 0
+    # Baris nama tanpa harga; dipakai kalau baris berikutnya cuma 'QTY x HARGA TOTAL'
+    pending_name = None
+
+    for line in str(ocr_text).splitlines():
+        line = re.sub(r"\brp\.?\s*", "Rp", line.strip(), flags=re.IGNORECASE)
+        tokens = line.split()
+        if not tokens:
+            continue
+
+        has_price = parse_price(tokens[-1]) is not None
+        if not has_price:
+            name_only = re.search(r"[A-Za-z]", line) and not any(parse_price(token) for token in tokens)
+            pending_name = line.strip(" .:-") if name_only and not _NOISE_RE.match(line) else None
+        if _SUBTOTAL_RE.match(line):
+            if has_price:
+                subtotal = parse_price(tokens[-1])
+            continue
+        if _SKIP_RE.match(line):
+            continue
+        if _TOTAL_RE.match(line):
+            if has_price and total is None:
+                total = parse_price(tokens[-1])
+            continue
+
+        if not has_price:
+            continue
+        item = _parse_item_line(tokens, pending_name)
+        pending_name = None
+        if item is not None:
+            items.append(item)
+        else:
+            unparsed += 1
+
+    if total is None:
+        total = subtotal
+
+    confidence = 0.0
+    if items and total:
+        matched = reconciles(items, subtotal or total) or reconciles(items, total)
+        confidence = (0.6 if matched else 0.0) + 0.4 * len(items) / (len(items) + unparsed)
+
+    return {"items": items, "subtotal": subtotal, "total": total or 0, "confidence": round(confidence, 3)}
+
+def _record(path: str, amount: int = 1):
+    with _stats_lock:
+        _parse_stats[path] += amount
+
+def get_parse_stats() -> dict:
+    """Berapa nota yang lolos fast-path lokal vs yang harus ke LLM (dan berapa yang kena cache)."""
+    with _stats_lock:
+        stats = dict(_parse_stats)
+    handled = stats["fast_path"] + stats["llm"]
+    stats["fast_path_rate"] = stats["fast_path"] / handled if handled else 0.0
+    stats["llm_cache_hit_rate"] = stats["llm_cache_hit"] / stats["llm"] if stats["llm"] else 0.0
+    return stats
+
+def parse_receipt(ocr_text: str):
+    """
+    Coba parser lokal dulu; kalau confidence rendah atau item nggak reconcile
+    dengan total, baru lempar ke parser backend (default: Qwen via HF Router API,
+    lihat parser_backends.PARSER_BACKEND).
+    """
+    local = parse_receipt_local(ocr_text)
+    if local["confidence"] >= FAST_PATH_MIN_CONFIDENCE:
+        _record("fast_path")
+        return local
 
-        text = r.json()["choices"][0]["message"]["content"]
+    # Import di sini: parser_backends import modul ini
+    from .parser_backends import get_parser_backend
 
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start == -1 or end == 0:
-            return {"items": [], "total": 0}
-            
-        data = json.loads(text[start:end])
-        return data
+    _record("llm")
+    return get_parser_backend().parse(ocr_text)
 
+def cached_llm_parse(ocr_text, model_name: str, generate, use_cache: bool = True) -> dict:
+    """
+    Kompak OCR text, cek cache respons, baru panggil `generate(prompt_text) -> (teks, jumlah token)`.
+    Teks yang sama (setelah normalisasi) langsung diambil dari cache, tanpa round trip.
+    """
+    prompt_text = compact_ocr_text(ocr_text)
+    key = llm_cache_key(prompt_text, model_name)
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        blob = cache.get(key)
+        if blob is not None:
+            entry = json.loads(blob)
+            _record("llm_cache_hit")
+            _record("cache_tokens_saved", entry["tokens"])
+            return entry["result"]
+
+    try:
+        text, tokens = generate(prompt_text)
+        _record("llm_request")
+        _record("compaction_tokens_saved", max(0, estimate_tokens(str(ocr_text)) - estimate_tokens(prompt_text)))
+        result = _extract_json(text)
     except Exception as e:
         print(f"Error Parsing: {e}")
-        return {"items": [], "total": 0}
\ No newline at end of file
+        return {"items": [], "total": 0}
+
+    # Hasil kosong jangan di-cache, bisa jadi cuma LLM lagi ngaco
+    if cache is not None and result.get("items"):
+        cache.set(key, json.dumps({"result": result, "tokens": tokens or estimate_tokens(prompt_text + text)}).encode())
+    return result
+
+def _parse_receipt_llm(ocr_text: str, use_cache: bool = True):
+    """
+    Kirim OCR text (sudah dikompak) ke Qwen via HF Router API buat dapet JSON bersih.
+    """
+    return cached_llm_parse(ocr_text, LLM_MODEL, _router_generate, use_cache)
+
+def _router_generate(prompt_text: str):
+    if not HF_TOKEN:
+        raise RuntimeError("HF_TOKEN belum diset.")
+
+    headers = {
+        "Authorization": f"Bearer {HF_TOKEN}",
+        "Content-Type": "application/json"
+    }
+    r = get_session().post(
+        API_URL,
+        headers=headers,
+        json=_build_payload(prompt_text),
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+    )
+    r.raise_for_status()
+
+    response = r.json()
+    usage = response.get("usage") or {}
+    return response["choices"][0]["message"]["content"], usage.get("total_tokens")
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _session_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="parse-receipt")
+        return _executor
+
+def parse_receipts(ocr_texts: List[str]) -> List[dict]:
+    """Versi sync untuk banyak nota sekaligus, urutan hasil sama dengan input."""
+    if len(ocr_texts) <= 1:
+        return [parse_receipt(text) for text in ocr_texts]
+    return list(_get_executor().map(parse_receipt, ocr_texts))
+
+async def aparse_receipt(ocr_text: str, semaphore: asyncio.Semaphore = None) -> dict:
+    """parse_receipt versi async, jalan di thread pool biar event loop nggak ke-block."""
+    loop = asyncio.get_running_loop()
+    if semaphore is None:
+        return await loop.run_in_executor(_get_executor(), parse_receipt, ocr_text)
+    async with semaphore:
+        return await loop.run_in_executor(_get_executor(), parse_receipt, ocr_text)
+
+async def parse_receipts_many(ocr_texts: List[str], max_concurrency: int = MAX_CONCURRENCY) -> List[dict]:
+    """Fan-out banyak OCR text sekaligus, maksimal `max_concurrency` request jalan bareng."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(*(aparse_receipt(text, semaphore) for text in ocr_texts))
@@ -1,20 +1,86 @@
+import io
+import os
+import time
 import cv2
 import numpy as np
 from PIL import Image
-from skimage.transform import hough_line, hough_line_peaks
-from skimage.feature import canny
-from skimage.color import rgb2gray
+
+# Deteksi kandidat rotasi cukup jalan di gambar kecil (jumlah pixel maksimal)
+ROTATION_PIXEL_BUDGET = 250_000
+# "opencv" (cv2.Canny + cv2.HoughLines) atau "skimage" (implementasi lama)
+ROTATION_BACKEND = "opencv"
+# Skor orientasi (projection profile) juga cukup di gambar kecil
+ORIENTATION_PIXEL_BUDGET = 250_000
+# Tiling nota panjang: overlap antar strip (fraksi tinggi strip)
+STRIP_OVERLAP = 0.15
+# "classic" (warp full-res lalu cv2.rotate) atau "single-warp" (crop + rotasi + resize dalam satu warpPerspective)
+PREPROCESS_MODE = os.getenv("PREPROCESS_MODE", "classic")
+# JPEG yang lebih besar dari ini di-decode langsung di resolusi 1/2, 1/4 atau 1/8 (draft mode).
+# Input model paling besar ~1 MP (Donut 1280x960); 3 MP masih sisa ruang untuk nota yang cuma
+# sebagian frame. Draft nggak pernah di bawah ukuran yang diminta, jadi budget ini harus <= 1/4
+# resolusi foto supaya kepakai: foto HP 12 MP (4032x3024) di-decode 1/2 -> 2016x1512.
+DECODE_PIXEL_BUDGET = int(os.getenv("PREPROCESS_DECODE_PIXELS", 3_000_000))
+# Kalau "1": foto yang punya tag EXIF Orientation dianggap sudah tegak setelah di-transpose
+# dan pencarian rotasi di-skip. Default off karena nota bisa tetap miring di frame (lihat nota_pensmart-180)
+TRUST_EXIF_ORIENTATION = os.getenv("PREPROCESS_TRUST_EXIF", "0") == "1"
+
+EXIF_ORIENTATION = 0x0112
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
 
 class ImagePreprocessor:
     @staticmethod
-    def load_image(image_file):
-        """Convert upload file/path to OpenCV format (BGR)"""
-        if isinstance(image_file, str):
-            image = Image.open(image_file)
+    def open_image(source):
+        """
+        Buka (lazy, header saja) dari path, bytes, mmap atau file-like (UploadedFile).
+        bytes dibungkus BytesIO tanpa copy; mmap & file dibaca langsung oleh PIL.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            return Image.open(source)
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return Image.open(io.BytesIO(source))
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return Image.open(source)
+
+    @staticmethod
+    def decode_image(source, max_pixels=DECODE_PIXEL_BUDGET, min_short_side=None):
+        """
+        Decode sekali ke PIL RGB + terapkan EXIF Orientation. Return (image, orientation).
+        JPEG yang jauh lebih besar dari yang dibutuhkan (`max_pixels`, atau sisi pendek
+        `min_short_side`) di-decode dengan DCT scaling, jadi pixel full-res nggak pernah dibuat.
+        """
+        image = ImagePreprocessor.open_image(source)
+        orientation = image.getexif().get(EXIF_ORIENTATION)
+
+        w, h = image.size
+        if min_short_side:
+            scale = min(1.0, min_short_side / float(min(w, h)))
+        elif max_pixels and w * h > max_pixels:
+            scale = (max_pixels / float(w * h)) ** 0.5
         else:
-            image = Image.open(image_file)
-        
-        return cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            scale = 1.0
+        if scale < 1.0:
+            # draft cuma ngecilin 1/2, 1/4, 1/8 dan hasilnya selalu >= ukuran yang diminta
+            image.draft("RGB", (int(w * scale), int(h * scale)))
+
+        image = image.convert("RGB")
+        if orientation in EXIF_TRANSPOSE:
+            image = image.transpose(EXIF_TRANSPOSE[orientation])
+        return image, orientation
+
+    @staticmethod
+    def load_image(image_file, max_pixels=DECODE_PIXEL_BUDGET):
+        """Convert upload file/path/bytes to OpenCV format (BGR)"""
+        image, _ = ImagePreprocessor.decode_image(image_file, max_pixels=max_pixels)
+        return cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
 
     @staticmethod
     def order_points(pts):
@@ -30,13 +96,7 @@ class ImagePreprocessor:
     @staticmethod
     def four_point_transform(image, pts):
         rect = ImagePreprocessor.order_points(pts)
-        (tl, tr, br, bl) = rect
-        widthA = np.sqrt(((br[0] - bl[0]) ** 2) + ((br[1] - bl[1]) ** 2))
-        widthB = np.sqrt(((tr[0] - tl[0]) ** 2) + ((tr[1] - tl[1]) ** 2))
-        maxWidth = max(int(widthA), int(widthB))
-        heightA = np.sqrt(((tr[0] - br[0]) ** 2) + ((tr[1] - br[1]) ** 2))
-        heightB = np.sqrt(((tl[0] - bl[0]) ** 2) + ((tl[1] - bl[1]) ** 2))
-        maxHeight = max(int(heightA), int(heightB))
+        maxWidth, maxHeight = ImagePreprocessor.quad_size(rect)
         dst = np.array([
             [0, 0],
             [maxWidth - 1, 0],
@@ -45,9 +105,32 @@ class ImagePreprocessor:
         M = cv2.getPerspectiveTransform(rect, dst)
         return cv2.warpPerspective(image, M, (maxWidth, maxHeight))
 
+    @staticmethod
+    def quad_size(rect):
+        """Ukuran (lebar, tinggi) hasil warp dari 4 titik yang sudah diurutkan."""
+        (tl, tr, br, bl) = rect
+        widthA = np.sqrt(((br[0] - bl[0]) ** 2) + ((br[1] - bl[1]) ** 2))
+        widthB = np.sqrt(((tr[0] - tl[0]) ** 2) + ((tr[1] - tl[1]) ** 2))
+        maxWidth = max(int(widthA), int(widthB))
+        heightA = np.sqrt(((tr[0] - br[0]) ** 2) + ((tr[1] - br[1]) ** 2))
+        heightB = np.sqrt(((tl[0] - bl[0]) ** 2) + ((tl[1] - bl[1]) ** 2))
+        maxHeight = max(int(heightA), int(heightB))
+        return maxWidth, maxHeight
+
     @staticmethod
     def robust_receipt_scanner(img_array):
         orig = img_array.copy()
+        quad = ImagePreprocessor.find_receipt_quad(img_array)
+        if quad is None:
+            return orig
+        return ImagePreprocessor.four_point_transform(orig, quad)
+
+    @staticmethod
+    def find_receipt_quad(img_array):
+        """
+        Cari 4 titik sudut nota (koordinat full-res) dari proxy tinggi 500px.
+        Cuma pakai channel saturation, jadi urutan channel (BGR/RGB) nggak ngaruh.
+        """
         ratio = img_array.shape[0] / 500.0
         h = 500
         w = int(img_array.shape[1] / ratio)
@@ -80,10 +163,10 @@ class ImagePreprocessor:
             screenCnt = np.int0(box)
 
         if screenCnt is None:
-            return orig 
+            return None
 
         screenCnt = screenCnt.astype("float32") * ratio
-        return ImagePreprocessor.four_point_transform(orig, screenCnt.reshape(4, 2))
+        return screenCnt.reshape(4, 2)
 
     @staticmethod
     def get_mean_error(data):
@@ -97,21 +180,62 @@ class ImagePreprocessor:
         return angle_deg - 180 if angle_deg > 90 else angle_deg
 
     @staticmethod
-    def get_rotation_candidates(image):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        gray = cv2.blur(gray, (4, 4))
+    def downscale_to_budget(image, max_pixels):
+        """Resize (INTER_AREA) supaya h*w <= max_pixels. Kalau sudah kecil, dikembalikan apa adanya."""
+        h, w = image.shape[:2]
+        if not max_pixels or h * w <= max_pixels:
+            return image
+        scale = (max_pixels / float(h * w)) ** 0.5
+        size = (max(1, int(w * scale)), max(1, int(h * scale)))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
 
-        edges = canny(gray) 
+    @staticmethod
+    def _hough_angles_skimage(gray):
+        # Import di sini: skimage lambat di-import dan cuma dipakai backend lama
+        from skimage.transform import hough_line, hough_line_peaks
+        from skimage.feature import canny
+
+        edges = canny(gray)
 
         tested_angles = np.deg2rad(np.arange(0.1, 180.0))
         h, theta, d = hough_line(edges, theta=tested_angles)
         _, angles, dists = hough_line_peaks(h, theta, d)
+        return np.rad2deg(angles)
+
+    @staticmethod
+    def _hough_angles_opencv(gray):
+        # sigma=1 seperti default canny skimage
+        gray = cv2.GaussianBlur(gray, (0, 0), 1)
+        edges = cv2.Canny(gray, 20, 50)
+
+        lines = cv2.HoughLinesWithAccumulator(edges, 1, np.pi / 180, 1)
+        if lines is None:
+            return np.array([])
+        lines = lines.reshape(-1, 3)
+        # Ambil garis dengan vote >= 50% maksimum (sama dengan threshold default hough_line_peaks)
+        votes = lines[:, 2]
+        strong = lines[votes >= 0.5 * votes.max()]
+        return np.rad2deg(strong[:, 1])
+
+    @staticmethod
+    def get_rotation_candidates(image, gray=None, backend=None, max_pixels=ROTATION_PIXEL_BUDGET):
+        if gray is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = ImagePreprocessor.downscale_to_budget(gray, max_pixels)
+        gray = cv2.blur(gray, (4, 4))
+
+        backend = backend or ROTATION_BACKEND
+        if backend == "opencv":
+            angles = ImagePreprocessor._hough_angles_opencv(gray)
+        elif backend == "skimage":
+            angles = ImagePreprocessor._hough_angles_skimage(gray)
+        else:
+            raise ValueError(f"Backend rotasi tidak dikenal: {backend}")
 
         horizontal_lines = []
         vertical_lines = []
 
-        for angle in angles:
-            angle_deg = np.rad2deg(angle)
+        for angle_deg in angles:
             if 75 <= angle_deg <= 105:
                 horizontal_lines.append(angle_deg)
             elif angle_deg <= 15 or angle_deg >= 165:
@@ -128,46 +252,202 @@ class ImagePreprocessor:
             return [0, 180]
 
     @staticmethod
-    def choose_rotation(img, candidates):
+    def projection_score(projection):
+        variance = np.var(projection)
+        mean = np.mean(projection)
+        peaks = np.sum(projection > mean * 1.5)
+        return variance * 0.5 + peaks * 50
+
+    @staticmethod
+    def score_orientations(gray, max_pixels=ORIENTATION_PIXEL_BUDGET):
+        """
+        Skor semua orientasi (0, 90, -90, 180) dari satu kali binarisasi.
+        Profil baris gambar yang diputar 0/180 = profil baris asli (dibalik),
+        90/-90 = profil kolom asli, jadi nggak perlu rotate gambar sama sekali.
+        """
+        gray = ImagePreprocessor.downscale_to_budget(gray, max_pixels)
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+        # Variance & jumlah peak nggak berubah kalau profil dibalik,
+        # jadi pasangan 0/180 dan 90/-90 selalu seri
+        row_score = ImagePreprocessor.projection_score(np.sum(binary, axis=1))
+        col_score = ImagePreprocessor.projection_score(np.sum(binary, axis=0))
+        return {0: row_score, 180: row_score, 90: col_score, -90: col_score}
+
+    @staticmethod
+    def choose_rotation(img, candidates, gray=None, return_scores=False):
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        scores = ImagePreprocessor.score_orientations(gray)
+
+        # Kalau seri, kandidat pertama yang menang (sama seperti sebelumnya)
         best_rotation = candidates[0]
         best_score = -1
-        
         for angle in candidates:
-            if angle == 0: rotated = img
-            elif angle == 90: rotated = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-            elif angle == -90: rotated = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            else: rotated = cv2.rotate(img, cv2.ROTATE_180)
-            
-            gray = cv2.cvtColor(rotated, cv2.COLOR_BGR2GRAY)
-            _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-            
-            h_projection = np.sum(binary, axis=1)
-            h_variance = np.var(h_projection)
-            h_mean = np.mean(h_projection)
-            h_peaks = np.sum(h_projection > h_mean * 1.5)
-            
-            score = h_variance * 0.5 + h_peaks * 50
-            
-            if score > best_score:
-                best_score = score
+            if scores[angle] > best_score:
+                best_score = scores[angle]
                 best_rotation = angle
-        
+
+        if return_scores:
+            return best_rotation, {angle: scores[angle] for angle in candidates}
         return best_rotation
 
     @staticmethod
-    def process_image(image_file) -> Image.Image:
-        """Main Pipeline: Load -> Warp -> Detect Rotation -> Correct Rotation"""
-        # 1. Load (BGR)
-        img = ImagePreprocessor.load_image(image_file)
+    def split_into_strips(image: Image.Image, strip_aspect=1.0, overlap=STRIP_OVERLAP, min_aspect=None):
+        """
+        Potong nota panjang jadi strip horizontal yang saling overlap.
+        Tinggi strip = lebar * strip_aspect (rasio input model), jadi strip nggak
+        di-squash waktu di-resize processor. Nota pendek dikembalikan utuh ([image]).
+        """
+        width, height = image.size
+        strip_height = max(1, int(round(width * strip_aspect)))
+        if min_aspect is None:
+            min_aspect = strip_aspect * 1.5
+        if height < width * min_aspect:
+            return [image]
+
+        step = max(1, int(strip_height * (1 - overlap)))
+        strips = []
+        top = 0
+        while True:
+            bottom = min(top + strip_height, height)
+            strips.append(image.crop((0, top, width, bottom)))
+            if bottom >= height:
+                break
+            top += step
+            # Strip terakhir jangan terlalu pendek, mundurin supaya tingginya penuh
+            if top + strip_height > height:
+                top = max(0, height - strip_height)
+        return strips
+
+    @staticmethod
+    def rotation_matrix(angle, width, height):
+        """Matriks 3x3 yang sama dengan cv2.rotate untuk angle 0/90/-90/180, plus ukuran barunya."""
+        if angle == 90:
+            return np.array([[0, -1, height - 1], [1, 0, 0], [0, 0, 1]], dtype=np.float64), (height, width)
+        if angle == -90:
+            return np.array([[0, 1, 0], [-1, 0, width - 1], [0, 0, 1]], dtype=np.float64), (height, width)
+        if angle == 180:
+            return np.array([[-1, 0, width - 1], [0, -1, height - 1], [0, 0, 1]], dtype=np.float64), (width, height)
+        return np.eye(3), (width, height)
+
+    @staticmethod
+    def warp_scaled(image, M, size, scale):
+        """
+        warpPerspective yang aman untuk downscale besar: kalau hasilnya < 1/2 ukuran asal,
+        source di-resize INTER_AREA dulu (supaya nggak aliasing) dan M disesuaikan.
+        """
+        if scale < 0.5:
+            factor = 2 * scale
+            image = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+            M = M @ np.diag([1 / factor, 1 / factor, 1])
+        return cv2.warpPerspective(image, M, size, flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    @staticmethod
+    def process_image_single_warp(image_file, target_size=None, timings=None) -> Image.Image:
+        """
+        Versi hemat memori: quad & orientasi dihitung di proxy kecil, lalu
+        crop perspektif + rotasi + resize ke lebar input model (`target_size` = (w, h))
+        digabung jadi satu matriks dan di-warp sekali langsung di RGB.
+        Yang disamakan cuma lebarnya, supaya nota panjang tetap bisa di-tiling.
+        """
+        clock = time.perf_counter()
+
+        def mark(stage):
+            nonlocal clock
+            now = time.perf_counter()
+            if timings is not None:
+                timings[stage] = now - clock
+            clock = now
+
+        # 1. Load langsung RGB (tanpa konversi ke BGR). Sisi pendek cukup 2x lebar input
+        # model (nota bisa cuma separuh lebar foto), sisanya nggak usah di-decode
+        min_short_side = 2 * target_size[0] if target_size else None
+        image, orientation = ImagePreprocessor.decode_image(image_file, min_short_side=min_short_side)
+        rgb = np.asarray(image)
+        mark("load")
+
+        # 2. Quad nota (atau seluruh gambar kalau nggak ketemu)
+        h, w = rgb.shape[:2]
+        quad = ImagePreprocessor.find_receipt_quad(rgb)
+        if quad is None:
+            rect = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
+        else:
+            rect = ImagePreprocessor.order_points(quad)
+        width, height = ImagePreprocessor.quad_size(rect)
+        dst = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype="float32")
+        M = cv2.getPerspectiveTransform(rect, dst)
+        mark("robust_receipt_scanner")
+
+        # 3 & 4. Rotasi dari proxy yang dibuat persis seperti mode classic (warp lalu
+        # downscale INTER_AREA). Proxy langsung dari warp_scaled bisa milih sudut lain
+        # (nota_pensmart-180), jadi warp sementara ini sengaja nggak dihemat.
+        best_angle = 0
+        if not (orientation and TRUST_EXIF_ORIENTATION):
+            warped = cv2.warpPerspective(rgb, M, (width, height))
+            proxy = ImagePreprocessor.downscale_to_budget(warped, ROTATION_PIXEL_BUDGET)
+            del warped
+            gray = cv2.cvtColor(proxy, cv2.COLOR_RGB2GRAY)
+
+            candidates = ImagePreprocessor.get_rotation_candidates(proxy, gray=gray)
+            mark("get_rotation_candidates")
+            best_angle = ImagePreprocessor.choose_rotation(proxy, candidates, gray=gray)
+            mark("choose_rotation")
+
+        # 5. Satu warp: perspektif -> rotasi -> resize ke lebar input model
+        R, (out_w, out_h) = ImagePreprocessor.rotation_matrix(best_angle, width, height)
+        scale = min(1.0, target_size[0] / float(out_w)) if target_size else 1.0
+        size = (max(1, int(round(out_w * scale))), max(1, int(round(out_h * scale))))
+        F = np.diag([scale, scale, 1]) @ R @ M
+        result = Image.fromarray(ImagePreprocessor.warp_scaled(rgb, F, size, scale))
+        mark("warp")
+        return result
+
+    @staticmethod
+    def process_image(image_file, timings=None, mode=None, target_size=None) -> Image.Image:
+        """
+        Main Pipeline: Load -> Warp -> Detect Rotation -> Correct Rotation
+        Kalau `timings` (dict) diberikan, durasi tiap stage (detik) dicatat di situ.
+        mode "single-warp" -> process_image_single_warp (pakai `target_size` engine).
+        """
+        mode = mode or PREPROCESS_MODE
+        if mode == "single-warp":
+            return ImagePreprocessor.process_image_single_warp(image_file, target_size, timings)
+        if mode != "classic":
+            raise ValueError(f"Mode preprocess tidak dikenal: {mode}")
+
+        clock = time.perf_counter()
+
+        def mark(stage):
+            nonlocal clock
+            now = time.perf_counter()
+            if timings is not None:
+                timings[stage] = now - clock
+            clock = now
+
+        # 1. Load (BGR, EXIF Orientation sudah diterapkan)
+        image, orientation = ImagePreprocessor.decode_image(image_file)
+        img = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+        mark("load")
         
         # 2. Warp / Scan
         warped = ImagePreprocessor.robust_receipt_scanner(img)
+        mark("robust_receipt_scanner")
         
-        # 3. Detect Candidates (Hough)
-        candidates = ImagePreprocessor.get_rotation_candidates(warped)
-        
-        # 4. Fix Orientation (Projection Score)
-        best_angle = ImagePreprocessor.choose_rotation(warped, candidates)
+        best_angle = 0
+        if not (orientation and TRUST_EXIF_ORIENTATION):
+            # Grayscale kecil dipakai bareng oleh step 3 & 4 (resize cuma sekali)
+            small = ImagePreprocessor.downscale_to_budget(warped, ROTATION_PIXEL_BUDGET)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+            # 3. Detect Candidates (Hough, di gambar kecil)
+            candidates = ImagePreprocessor.get_rotation_candidates(warped, gray=gray)
+            mark("get_rotation_candidates")
+
+            # 4. Fix Orientation (Projection Score)
+            best_angle = ImagePreprocessor.choose_rotation(warped, candidates, gray=gray)
+            mark("choose_rotation")
         
         final_img = warped
         if best_angle == 90:
@@ -177,4 +457,6 @@ class ImagePreprocessor:
         elif best_angle == 180:
             final_img = cv2.rotate(warped, cv2.ROTATE_180)
 
-        return Image.fromarray(cv2.cvtColor(final_img, cv2.COLOR_BGR2RGB))
\ No newline at end of file
+        result = Image.fromarray(cv2.cvtColor(final_img, cv2.COLOR_BGR2RGB))
+        mark("rotate")
+        return result
\ No newline at end of file
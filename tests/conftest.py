@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Sama dengan PATH SETUP di src/app.py: root repo (import src.*) + src/model (import base)
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (root_dir, os.path.join(root_dir, "src", "model")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
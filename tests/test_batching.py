@@ -0,0 +1,53 @@
+"""MicroBatcher: batching request run() dan penutupan yang nggak ninggalin Future menggantung."""
+import threading
+
+import pytest
+from PIL import Image
+
+from src.model.batching import BatcherClosed, MicroBatcher
+from src.model.stub import StubModel
+
+IMAGE = Image.new("RGB", (32, 32), "white")
+
+def make_batcher():
+    return MicroBatcher(StubModel(input_size=(8, 8)), max_batch_size=4, max_wait_ms=5)
+
+def test_run_returns_receipt():
+    batcher = make_batcher()
+    try:
+        assert batcher.run(IMAGE).total == 66000
+    finally:
+        batcher.close()
+
+def test_submit_after_close_raises():
+    batcher = make_batcher()
+    batcher.close()
+
+    with pytest.raises(BatcherClosed):
+        batcher.submit(IMAGE)
+
+def test_close_racing_submit_never_leaves_pending_futures():
+    for _ in range(20):
+        batcher = make_batcher()
+        futures = []
+
+        def submit_many():
+            for _ in range(10):
+                try:
+                    futures.append(batcher.submit(IMAGE))
+                except BatcherClosed:
+                    return
+
+        threads = [threading.Thread(target=submit_many) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        batcher.close()
+        for thread in threads:
+            thread.join()
+
+        # Tiap job yang diterima submit selesai (hasil atau BatcherClosed), nggak ada yang hang
+        for future in futures:
+            try:
+                future.result(timeout=5)
+            except BatcherClosed:
+                pass
@@ -0,0 +1,92 @@
+"""Kontrak AIModel: stage pipeline abstract, wrapper tetap bisa dibuat dan di-warm-up."""
+from collections import Counter
+
+import pytest
+import torch
+from PIL import Image
+
+from src.model import florence
+
+from src.model.base import AIModel
+from src.model.cached import CachedModel
+from src.model.cascade import CascadeModel
+from src.model.florence import ADAPTIVE, BEAM, GREEDY, DecodingConfig, FlorenceModel, Generation
+from src.model.registry import warmup
+from src.model.remote import RemoteModel
+from src.model.stub import StubModel
+from src.utility.parsing import parse_receipt_local
+
+class NoPostprocessing(AIModel):
+    def _preprocess(self, image):
+        return image
+
+    def _inference(self, inputs):
+        return inputs
+
+def test_engine_missing_a_stage_cannot_be_instantiated():
+    with pytest.raises(TypeError, match="_postprocessing"):
+        NoPostprocessing()
+
+def test_wrappers_implement_every_stage():
+    stub = StubModel(input_size=(8, 8))
+    cascade = CascadeModel(tiers=["stub", "stub"], loader=lambda name: stub)
+    # Cache nggak kesentuh: stage dipanggil langsung, nggak lewat run
+    cached = CachedModel(stub, cache=None)
+    # Cukup bisa dibuat (stage-nya lengkap); request ke server dites di test_server.py
+    RemoteModel("stub")
+
+    for model in (cascade, cached):
+        warmup(model)
+        image = Image.new("RGB", (32, 32), "white")
+        output = model._inference(model._preprocess([image]))
+        assert model._postprocessing_batch(output, [image]) == [stub.text]
+
+class FakeFlorence(FlorenceModel):
+    """FlorenceModel tanpa weights: teks per strip & confidence greedy sudah ditentukan."""
+    def __init__(self, greedy, beam, confidence):
+        self.decoding = DecodingConfig(mode=ADAPTIVE)
+        self.decoding_stats = Counter()
+        self.input_size = (768, 768)
+        self.texts = {GREEDY: greedy, BEAM: beam}
+        self.strip_confidence = confidence
+        self.beamed = []
+
+    def strips(self, image):
+        return [image] * len(self.texts[GREEDY])
+
+    def _preprocess(self, image):
+        return {"index": torch.arange(len(image))}
+
+    def _generate(self, inputs, path, streamer=None, should_stop=None):
+        indices = inputs["index"].tolist()
+        if path == BEAM:
+            self.beamed.append(indices)
+            return Generation(indices, BEAM)
+        return Generation(indices, GREEDY, [self.strip_confidence[i] for i in indices])
+
+    def _postprocessing_batch(self, generation, images):
+        return [self.texts[generation.path][i] for i in generation.sequences]
+
+GOOD_STRIPS = ["WARUNG\n2 NASI GORENG 50.000", "ES TEH x2 10.000\nTOTAL 60.000"]
+
+@pytest.fixture
+def local_parse(monkeypatch):
+    # Parse lokal saja, hasil yang nggak cocok total jangan sampai lari ke LLM
+    monkeypatch.setattr(florence, "parse_receipts", lambda texts: [parse_receipt_local(t) for t in texts])
+
+@pytest.mark.parametrize("greedy, confidence, beamed, decoding", [
+    (GOOD_STRIPS, [0.9, 0.9], [], GREEDY),
+    # Strip kedua ragu-ragu: cuma strip itu yang di-beam
+    (GOOD_STRIPS, [0.9, 0.5], [[1]], f"{GREEDY}->{BEAM}"),
+    # Semua strip yakin tapi total gabungan nggak cocok: semua strip di-beam
+    ([GOOD_STRIPS[0], "ES TEH x2 10.000\nTOTAL 99.000"], [0.9, 0.9], [[0, 1]], f"{GREEDY}->{BEAM}"),
+])
+def test_florence_tiled_escalates_to_beam(local_parse, greedy, confidence, beamed, decoding):
+    model = FakeFlorence(greedy, GOOD_STRIPS, confidence)
+
+    receipt = model.run_tiled(Image.new("RGB", (32, 64), "white"))
+
+    assert model.beamed == beamed
+    assert receipt.meta["decoding"] == decoding
+    assert receipt.meta["tiles"] == 2
+    assert receipt.total == 60000
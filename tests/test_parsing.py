@@ -0,0 +1,69 @@
+"""Parser rule-based lokal (fast-path sebelum LLM) dan kompaksi prompt."""
+import json
+
+from src.utility.parsing import FAST_PATH_MIN_CONFIDENCE, compact_ocr_text, estimate_tokens, parse_receipt_local
+
+def test_restaurant_layout():
+    result = parse_receipt_local("2 NASI GORENG 50.000\nES TEH x2 10.000\nSUBTOTAL 60.000\nPPN 6.000\nTOTAL 66.000")
+
+    assert result["items"] == [
+        {"name": "NASI GORENG", "qty": 2, "price": 50000},
+        {"name": "ES TEH", "qty": 2, "price": 10000},
+    ]
+    assert (result["subtotal"], result["total"]) == (60000, 66000)
+    assert result["confidence"] >= FAST_PATH_MIN_CONFIDENCE
+
+def test_minimarket_name_line_above_qty_line():
+    result = parse_receipt_local(
+        "INDOMARET\nJl. Raya 1\nINDOMIE GORENG\n2 x 3.000 6.000\nAQUA 600ML\n1 x 3.500 3.500\nTOTAL 9.500"
+    )
+
+    assert result["items"] == [
+        {"name": "INDOMIE GORENG", "qty": 2, "price": 6000},
+        {"name": "AQUA 600ML", "qty": 1, "price": 3500},
+    ]
+    assert result["total"] == 9500
+
+def test_qty_separator_is_not_an_item_name():
+    result = parse_receipt_local("AQUA 600ML\n2 @ 3.500 7.000\nTOTAL 7.000")
+
+    assert [item["name"] for item in result["items"]] == ["AQUA 600ML"]
+    assert all(item["name"].lower() not in ("x", "@") for item in result["items"])
+
+def test_qty_line_without_name_is_not_fast_path():
+    result = parse_receipt_local("2 x 3.500 7.000\nTOTAL 7.000")
+
+    assert result["items"] == []
+    assert result["confidence"] < FAST_PATH_MIN_CONFIDENCE
+
+FLORENCE_TEXT = (
+    "WARUNG MAKAN SEDERHANA Jl. Raya Bogor No. 12 Telp 021-8765432 12/03/2024 19:45 "
+    "2 NASI GORENG 50.000 2 ES TEH 10.000 SUBTOTAL 60.000 PB1 10% 6.000 TOTAL 66.000 "
+    "Terima kasih atas kunjungan Anda"
+)
+
+def test_compact_splits_single_line_ocr_on_prices():
+    compact = compact_ocr_text(FLORENCE_TEXT)
+
+    assert compact.splitlines() == [
+        "WARUNG MAKAN SEDERHANA",
+        "2 NASI GORENG 50.000",
+        "2 ES TEH 10.000",
+        "SUBTOTAL 60.000",
+        "PB1 10% 6.000",
+        "TOTAL 66.000",
+    ]
+    assert estimate_tokens(compact) < estimate_tokens(FLORENCE_TEXT)
+
+def test_compact_keeps_only_cord_price_fields():
+    cord = {
+        "menu": [{"nm": "NASI GORENG", "cnt": "2", "price": "50,000", "num": "1", "itemsubtotal": "50,000"}],
+        "sub_total": {"subtotal_price": "50,000", "etc": "PB1"},
+        "total": {"total_price": "55,000", "cashprice": "100,000", "changeprice": "45,000", "menuqty_cnt": "2"},
+    }
+
+    assert json.loads(compact_ocr_text(cord)) == {
+        "menu": [{"nm": "NASI GORENG", "cnt": "2", "price": "50,000"}],
+        "sub_total": {"subtotal_price": "50,000"},
+        "total": {"total_price": "55,000"},
+    }
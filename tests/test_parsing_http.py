@@ -0,0 +1,128 @@
+"""parse_receipt lewat HTTP ke stand-in chat-completions lokal (tanpa HF Router)."""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.utility import parser_backends, parsing
+
+# Nggak lolos fast-path lokal (nggak ada total), jadi selalu ke LLM
+OCR_TEXT = "WARUNG TEST\nNASI GORENG 25.000"
+LLM_RESULT = {"merchant": "WARUNG TEST", "items": [{"name": "NASI GORENG", "qty": 1, "price": 25000}], "total": 25000}
+
+class ChatServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ChatHandler)
+        self.failures = 0      # jumlah request pertama yang dijawab 503
+        self.drops = 0         # jumlah request pertama yang koneksinya diputus tanpa jawaban
+        self.delay = 0.0       # detik sebelum jawab
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+class ChatHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+            attempt = server.requests
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            time.sleep(server.delay)
+            if attempt <= server.drops:
+                # Seperti keep-alive basi yang ditutup server: client dapat koneksi putus, bukan status
+                self.close_connection = True
+            elif attempt <= server.failures:
+                self._send(503, {"error": "overloaded"})
+            else:
+                content = json.dumps(LLM_RESULT)
+                self._send(200, {"choices": [{"message": {"content": content}}], "usage": {"total_tokens": 42}})
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client sudah nyerah (timeout)
+            pass
+
+@pytest.fixture
+def chat_server(monkeypatch):
+    server = ChatServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(parsing, "API_URL", f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions")
+    monkeypatch.setattr(parsing, "HF_TOKEN", "test-token")
+    monkeypatch.setattr(parsing, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(parsing, "RETRY_BACKOFF", 0)
+    monkeypatch.setattr(parsing, "READ_TIMEOUT", 0.5)
+    # Session & backend dibuat ulang dengan setting di atas
+    monkeypatch.setattr(parsing, "_session", None)
+    monkeypatch.setattr(parser_backends, "_backend", parser_backends.RouterBackend(use_cache=False))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_retries_503_then_succeeds(chat_server):
+    chat_server.failures = 2
+
+    result = parsing.parse_receipt(OCR_TEXT)
+
+    assert result["items"] == LLM_RESULT["items"]
+    assert chat_server.requests == 3
+
+def test_gives_up_after_max_retries(chat_server):
+    chat_server.failures = parsing.MAX_RETRIES + 1
+
+    result = parsing.parse_receipt(OCR_TEXT)
+
+    assert result == {"items": [], "total": 0}
+    assert chat_server.requests == parsing.MAX_RETRIES + 1
+
+def test_dropped_connection_is_retried(chat_server):
+    chat_server.drops = 2
+
+    result = parsing.parse_receipt(OCR_TEXT)
+
+    assert result["items"] == LLM_RESULT["items"]
+    assert chat_server.requests == 3
+
+def test_read_timeout_is_not_retried(chat_server):
+    chat_server.delay = 2.0
+
+    start = time.perf_counter()
+    result = parsing.parse_receipt(OCR_TEXT)
+    elapsed = time.perf_counter() - start
+
+    assert result == {"items": [], "total": 0}
+    assert chat_server.requests == 1
+    assert elapsed < 1.5
+
+def test_parse_receipts_many_bounds_concurrency(chat_server):
+    chat_server.delay = 0.2
+    texts = [f"{OCR_TEXT}\nMEJA {i}" for i in range(6)]
+
+    results = asyncio.run(parsing.parse_receipts_many(texts, max_concurrency=3))
+
+    assert [r["items"] for r in results] == [LLM_RESULT["items"]] * len(texts)
+    assert chat_server.requests == len(texts)
+    assert 1 < chat_server.max_in_flight <= 3
@@ -0,0 +1,34 @@
+"""Preprocessing: mode single-warp harus ambil keputusan rotasi yang sama dengan classic."""
+import glob
+import os
+
+import pytest
+
+from src.utility.preprocessing import ImagePreprocessor
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SAMPLES = sorted(glob.glob(os.path.join(DATA_DIR, "*.jp*g")))
+
+def chosen_angle(monkeypatch, path, **kwargs):
+    angles = []
+    choose_rotation = ImagePreprocessor.choose_rotation
+
+    def spy(*args, **kw):
+        angle = choose_rotation(*args, **kw)
+        angles.append(angle)
+        return angle
+
+    monkeypatch.setattr(ImagePreprocessor, "choose_rotation", staticmethod(spy))
+    image = ImagePreprocessor.process_image(path, **kwargs)
+    monkeypatch.undo()
+    return angles, image
+
+@pytest.mark.parametrize("target_size", [None, (960, 1280), (768, 768)])
+@pytest.mark.parametrize("path", SAMPLES, ids=os.path.basename)
+def test_single_warp_matches_classic_rotation(monkeypatch, path, target_size):
+    classic_angles, classic = chosen_angle(monkeypatch, path, mode="classic")
+    warp_angles, warped = chosen_angle(monkeypatch, path, mode="single-warp", target_size=target_size)
+
+    assert warp_angles == classic_angles
+    # Orientasi hasil (portrait / landscape) juga sama
+    assert (warped.width < warped.height) == (classic.width < classic.height)
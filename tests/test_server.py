@@ -0,0 +1,118 @@
+"""Round trip RemoteModel -> inference server (engine stub) lewat TCP dan Unix socket."""
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from src.model.remote import RemoteModel
+from src.model.stub import StubModel
+from src.server import InferenceService, make_server
+
+@pytest.fixture(params=["tcp", "unix"])
+def server_url(request, tmp_path):
+    service = InferenceService(max_batch_size=4, max_wait_ms=20, cache=False)
+    if request.param == "unix":
+        path = str(tmp_path / "ocr.sock")
+        server = make_server(service, unix_path=path)
+        url = f"unix://{path}"
+    else:
+        server = make_server(service, port=0)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield url
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+def summary(receipt):
+    return sorted((it.name, it.count, it.total_price) for it in receipt.items.values()), receipt.total
+
+def test_warmup_reports_engine_info(server_url):
+    remote = RemoteModel("stub", url=server_url)
+    remote.warmup()
+
+    assert remote.input_size == StubModel().input_size
+    assert remote.generation_settings()["remote"] == "stub"
+
+def test_run_matches_local_engine(server_url):
+    image = Image.new("RGB", (400, 600), "white")
+
+    receipt = RemoteModel("stub", url=server_url).run(image)
+
+    assert summary(receipt) == summary(StubModel().run(image))
+
+def test_run_batch_goes_through_server(server_url):
+    images = [Image.new("RGB", (400, 600), color) for color in ("white", "gray", "black")]
+
+    receipts = RemoteModel("stub", url=server_url).run_batch(images)
+
+    assert len(receipts) == 3
+    assert all(summary(r) == summary(receipts[0]) for r in receipts)
+
+def test_run_tiled_matches_local_engine(server_url):
+    # Jauh lebih tinggi dari input stub (768x768), jadi dipotong jadi beberapa strip
+    image = Image.new("RGB", (300, 2400), "white")
+
+    receipt = RemoteModel("stub", url=server_url).run_tiled(image)
+    local = StubModel().run_tiled(image)
+
+    assert summary(receipt) == summary(local)
+    assert receipt.meta["tiles"] == local.meta["tiles"] > 1
+
+def test_unknown_engine_is_an_error(server_url):
+    with pytest.raises(RuntimeError, match="404"):
+        RemoteModel("nope", url=server_url).run(Image.new("RGB", (100, 100), "white"))
+
+def test_scan_retries_when_batcher_dropped_mid_request(monkeypatch):
+    service = InferenceService(max_batch_size=4, max_wait_ms=5, cache=False)
+    image = Image.new("RGB", (64, 64), "white")
+    batcher = service.batcher
+    calls = []
+
+    def evicted_batcher(name):
+        # Interleaving terburuk: engine di-evict persis setelah scan ambil batcher, sebelum submit
+        calls.append(name)
+        result = batcher(name)
+        if len(calls) == 1:
+            service._drop_batcher(name)
+        return result
+
+    monkeypatch.setattr(service, "batcher", evicted_batcher)
+    try:
+        assert summary(service.scan("stub", image)) == summary(StubModel().run(image))
+    finally:
+        service.close()
+    assert len(calls) == 2
+
+def test_scan_survives_batcher_dropped_by_eviction():
+    service = InferenceService(max_batch_size=4, max_wait_ms=5, cache=False)
+    image = Image.new("RGB", (64, 64), "white")
+    expected = summary(StubModel().run(image))
+    errors, stop = [], threading.Event()
+
+    def scan_loop():
+        while not stop.is_set():
+            try:
+                assert summary(service.scan("stub", image)) == expected
+            except Exception as e:
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=scan_loop) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        # Batcher dibuang berkali-kali di tengah scan, seperti waktu registry evict engine
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            service._drop_batcher("stub")
+            time.sleep(0.001)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        service.close()
+
+    assert errors == []